@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 # Add parent directory to python path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -8,6 +9,10 @@ from dotenv import load_dotenv
 from openai import OpenAI
 import chromadb
 from config import CHROMA_DB_PATH, VOYAGER_API_KEY, EXPECTED_SOURCES
+from CODE.utilities.embeddings import LocalEmbedder
+from CODE.utilities.retrieval import query_by_source
+from CODE.utilities.vector_sync import content_version
+from CODE.utilities.answer_cache import SemanticAnswerCache
 
 # Load environment variables
 load_dotenv()
@@ -31,35 +36,80 @@ def get_chroma_collection():
         return None
 
 collection = get_chroma_collection()
+# Queries must be embedded by the same local model as the stored documents
+embedder = LocalEmbedder()
 
-def get_rag_response(user_query):
+# One answer cache for every session, so a question asked by one analyst is answered from memory for the next
+@st.cache_resource
+def get_answer_cache():
+    return SemanticAnswerCache()
+
+answer_cache = get_answer_cache()
+
+def current_content_version():
+    """Re-reads the collection's content version, so a re-index while the app runs invalidates cached answers."""
+    try:
+        return content_version(chromadb.PersistentClient(path=CHROMA_DB_PATH).get_collection(name="market_intelligence"))
+    except Exception as e:
+        print(f"Warning: could not read the collection version: {e}")
+        return None
+
+# Documents per source in the context; chunks are over-fetched so several chunks of one document still leave enough
+# (the combined query asks for CHUNKS_PER_SOURCE x number of sources)
+RESULTS_PER_SOURCE = 3
+CHUNKS_PER_SOURCE = 9
+
+# Index bookkeeping that is never shown to the LLM
+INTERNAL_METADATA = ['parent_id', 'chunk_index', 'chunk_count', 'embedding_model']
+
+def lookup_cached_answer(query_embedding, version):
+    """The cached entry for a similar question, or None. A failing cache is skipped rather than failing the turn."""
+    try:
+        return answer_cache.lookup(query_embedding, version)
+    except Exception as e:
+        print(f"Warning: answer cache lookup failed, answering without it: {e}")
+        return None
+
+def store_answer(cache_key, question, answer, context):
+    try:
+        answer_cache.store(*cache_key, question, answer, context)
+    except Exception as e:
+        print(f"Warning: could not cache the answer: {e}")
+
+def build_messages(user_query, metrics):
+    """
+    Embeds the query once, for the answer cache and, on a miss, for retrieval.
+    Returns (messages, None, cache_key, context), or (None, text to show instead of a generated answer, None, context).
+    A cache hit returns the cached answer with the context it cited and records its similarity in `metrics`;
+    other early returns carry no context.
+    """
     if not collection:
-        return "ChromaDB connection is not available."
+        return None, "ChromaDB connection is not available.", None, None
     
     try:
+        query_embedding = embedder([user_query])[0]
+        cache_key = (query_embedding, current_content_version())
+        cached = lookup_cached_answer(*cache_key)
+        if cached is not None:
+            metrics["cache_similarity"] = cached["similarity"]
+            return None, cached["answer"], None, cached["context"]
+
         sources = EXPECTED_SOURCES
         all_documents = []
         all_metadatas = []
-        
-        for source in sources:
-            try:
-                results = collection.query(
-                    query_texts=[user_query],
-                    n_results=3,
-                    where={"source": source}
-                )
-                if results['documents'] and results['documents'][0]:
-                    all_documents.extend(results['documents'][0])
-                    all_metadatas.extend(results['metadatas'][0] if 'metadatas' in results and results['metadatas'] else [{}] * len(results['documents'][0]))
-            except Exception as e:
-                error_msg = f"Warning: Failed to retrieve from source {source}: {e}"
+        # Retrieve every source from one over-fetched query, merge per source in memory
+        for source, documents, metadatas, error in query_by_source(collection, query_embedding, sources, RESULTS_PER_SOURCE, CHUNKS_PER_SOURCE):
+            if error is not None:
+                error_msg = f"Warning: Failed to retrieve from source {source}: {error}"
                 print(error_msg)
                 all_documents.append(error_msg)
                 all_metadatas.append({"source": source, "author_name": "System", "post_url": "N/A"})
                 continue
+            all_documents.extend(documents)
+            all_metadatas.extend(metadatas)
         
         if not all_documents:
-            return "No relevant context found in the database."
+            return None, "No relevant context found in the database.", None, None
         
         # Construct context string
         context_parts = []
@@ -80,7 +130,7 @@ def get_rag_response(user_query):
 
             # Add other granular metadata
             for key, value in meta.items():
-                if key not in ['source', 'author_name', 'post_url', 'source_topic', 'importance', 'chunk_id'] and value:
+                if key not in ['source', 'author_name', 'post_url', 'source_topic', 'importance', 'chunk_id'] + INTERNAL_METADATA and value:
                     context_str += f"{key.replace('_', ' ').title()}: {value}\n"
             
             context_str += f"Content: {doc}\n"
@@ -105,15 +155,43 @@ def get_rag_response(user_query):
             {"role": "user", "content": f"Context:\n{context_string}\n\nQuery:\n{user_query}"}
         ]
         
-        response = client.chat.completions.create(
+        return messages, None, cache_key, context_string
+        
+    except Exception as e:
+        return None, f"An error occurred while generating the response: {str(e)}", None, None
+
+def stream_response(messages, metrics):
+    """
+    Yields the answer as the LLM generates it, for st.write_stream.
+    Fills `metrics` with time to first token ("ttft") and total generation time ("total"), in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        stream = client.chat.completions.create(
             model="qwen3-235b-a22b-instruct-2507",
-            messages=messages
+            messages=messages,
+            stream=True
         )
-        
-        return response.choices[0].message.content
-        
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if "ttft" not in metrics:
+                    metrics["ttft"] = time.perf_counter() - start
+                yield delta
     except Exception as e:
-        return f"An error occurred while generating the response: {str(e)}"
+        metrics["error"] = True
+        yield f"An error occurred while generating the response: {str(e)}"
+    metrics["total"] = time.perf_counter() - start
+    print(f"LLM answer: first token {metrics.get('ttft', float('nan')):.2f}s, total {metrics['total']:.2f}s")
+
+def format_metrics(metrics):
+    if "cache_similarity" in metrics:
+        return f"⚡ Answered from cache (question similarity {metrics['cache_similarity']:.2f})"
+    if "ttft" not in metrics:
+        return f"⏱️ No tokens received · total {metrics['total']:.1f}s"
+    return f"⏱️ First token {metrics['ttft']:.1f}s · total {metrics['total']:.1f}s"
 
 # Streamlit UI
 st.title("TrendScout AI")
@@ -126,6 +204,11 @@ if "messages" not in st.session_state:
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        if message.get("metrics"):
+            st.caption(format_metrics(message["metrics"]))
+        if message.get("context"):
+            with st.expander("Cited context"):
+                st.text(message["context"])
 
 # React to user input
 if prompt := st.chat_input("Ask about market trends..."):
@@ -134,11 +217,25 @@ if prompt := st.chat_input("Ask about market trends..."):
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
 
-    # Get response and display
+    # Cache hits and failures are shown as they are; misses retrieve under the spinner, then stream the answer
+    metrics = {}
+    cited_context = None
     with st.chat_message("assistant"):
         with st.spinner("Analyzing market data..."):
-            response = get_rag_response(prompt)
+            messages, response, cache_key, context = build_messages(prompt, metrics)
+        if messages is None:
             st.markdown(response)
+            if "cache_similarity" in metrics:
+                st.caption(format_metrics(metrics))
+                # A cached answer is shown with the context it cited, since that context was not retrieved for this question
+                cited_context = context
+                with st.expander("Cited context"):
+                    st.text(cited_context)
+        else:
+            response = st.write_stream(stream_response(messages, metrics))
+            st.caption(format_metrics(metrics))
+            if "ttft" in metrics and not metrics.get("error"):
+                store_answer(cache_key, prompt, response, context)
     
     # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response})
+    st.session_state.messages.append({"role": "assistant", "content": response, "metrics": metrics, "context": cited_context})
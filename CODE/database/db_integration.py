@@ -1,24 +1,393 @@
 import os
 import json
+import time
+import hashlib
+import random
+import zlib
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError
 from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, FINAL_KG_PATH, SCHEMA_CONFIG
 from CODE.utilities.checkpoint_manager import CheckpointManager
 
-def ingest_data():
+# How many rows to send per UNWIND statement in bulk mode
+BATCH_SIZE = 1000
+
+# Parallel writer sessions. Each worker thread owns one driver session.
+WORKERS = min(8, os.cpu_count() or 1)
+
+# Extra attempts per batch once execute_write's own transient-error retries are exhausted
+MAX_BATCH_RETRIES = 3
+
+# Checkpoint holding the fingerprints of every row already applied to Neo4j
+DELTA_STATE_NAME = "neo4j_delta"
+
+def clean_label(entity):
+    """Turns an entity's type into a valid Cypher label."""
+    label = str(entity.get("type", "Entity")).replace(" ", "_").replace("-", "_")
+    return label or "Entity"
+
+def clean_relation_type(rel):
+    """Turns a relationship's verb into a valid Cypher relationship type."""
+    relation_type = str(rel.get("relation", "RELATED_TO")).replace(" ", "_").replace("-", "_").upper()
+    return relation_type or "RELATED_TO"
+
+def build_label_index(data):
+    """Maps every entity name to the first schema label it was extracted with."""
+    label_index = {}
+    for item in data:
+        for entity in item.get("entities", []):
+            name = entity.get("name")
+            label = clean_label(entity)
+            if name and label in SCHEMA_CONFIG["NODE_LABELS"]:
+                label_index.setdefault(name, label)
+    return label_index
+
+def collect_rows(data, label_index=None):
+    """
+    Groups every valid node by label and every valid relationship by (type, source label, target label).
+    Endpoint labels come from the entity list of the same document first, then from the whole graph,
+    so relationship MATCHes can use the per-label name index.
+    Returns (node_rows, rel_rows), each a dict of group key -> list of parameter rows.
+    """
+    if label_index is None:
+        label_index = build_label_index(data)
+
+    node_rows = defaultdict(list)
+    rel_rows = defaultdict(list)
+    unresolved = 0
+
+    for item in data:
+        doc_labels = {}
+        for entity in item.get("entities", []):
+            name = entity.get("name")
+            label = clean_label(entity)
+            if not name:
+                continue
+            if label not in SCHEMA_CONFIG["NODE_LABELS"]:
+                print(f"Skipping node '{name}': Label '{label}' not in allowed schema.")
+                continue
+            doc_labels.setdefault(name, label)
+            node_rows[label].append({"name": name, "sentiment": entity.get("sentiment", "neutral")})
+
+        for rel in item.get("relationships", []):
+            source = rel.get("source")
+            target = rel.get("target")
+            relation_type = clean_relation_type(rel)
+            if not source or not target:
+                continue
+            if relation_type not in SCHEMA_CONFIG["RELATIONSHIP_TYPES"]:
+                print(f"Skipping relation {source}-[{relation_type}]->{target}: Type not in allowed schema.")
+                continue
+            source_label = doc_labels.get(source) or label_index.get(source)
+            target_label = doc_labels.get(target) or label_index.get(target)
+            if not source_label or not target_label:
+                # Endpoint was never extracted as an entity, so no node exists to MATCH
+                unresolved += 1
+                continue
+            rel_rows[(relation_type, source_label, target_label)].append({"source": source, "target": target})
+
+    if unresolved:
+        print(f"Skipped {unresolved} relationships whose endpoints are not known entities.")
+    return node_rows, rel_rows
+
+def create_constraints(session):
+    """
+    Creates a uniqueness constraint on `name` for every schema label.
+    Each constraint is backed by a range index, which is what the MERGE/MATCH lookups hit.
+    """
+    for label in SCHEMA_CONFIG["NODE_LABELS"]:
+        session.run(f"""
+        CREATE CONSTRAINT `{label.lower()}_name_unique` IF NOT EXISTS
+        FOR (n:`{label}`) REQUIRE n.name IS UNIQUE
+        """).consume()
+    session.run("CALL db.awaitIndexes()").consume()
+    print(f"Ensured name constraints for {len(SCHEMA_CONFIG['NODE_LABELS'])} labels.")
+
+def relationship_query(relation_type, source_label, target_label, prefix="row."):
+    return f"""
+        MATCH (s:`{source_label}` {{name: {prefix}source}})
+        MATCH (t:`{target_label}` {{name: {prefix}target}})
+        MERGE (s)-[r:`{relation_type}`]->(t)
+        """
+
+def node_query(label):
+    return f"""
+        UNWIND $rows AS row
+        MERGE (n:`{label}` {{name: row.name}})
+        SET n.sentiment = row.sentiment
+        """
+
+def _run_batch(tx, query, rows):
+    tx.run(query, rows=rows).consume()
+
+def execute_batch(session, query, rows):
+    """
+    Runs one UNWIND batch in a managed write transaction.
+    execute_write already retries transient errors (deadlocks included) for the driver's
+    max_transaction_retry_time; if a batch still fails we back off with jitter, so parallel
+    writers that keep colliding on the same nodes fall out of step, and try again.
+    """
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        try:
+            session.execute_write(_run_batch, query, rows)
+            return
+        except TransientError as e:
+            if attempt == MAX_BATCH_RETRIES:
+                raise
+            delay = 2 ** attempt + random.random()
+            tqdm.write(f"⚠️ Transient error ({e.code}) on batch of {len(rows)} rows. Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+def make_batches(desc, query, rows, batch_size):
+    return [(desc, query, rows[i:i + batch_size]) for i in range(0, len(rows), batch_size)]
+
+def _run_job(driver, items):
+    """Runs a list of (desc, query, rows) batches in order on one session and returns their timings."""
+    timings = []
+    with driver.session() as session:
+        for desc, query, rows in items:
+            start = time.perf_counter()
+            execute_batch(session, query, rows)
+            timings.append((desc, len(rows), time.perf_counter() - start))
+    return timings
+
+def run_jobs(driver, jobs, workers=WORKERS):
+    """
+    Runs independent jobs on a pool of driver sessions and reports throughput.
+    rows/sec per label or relationship type is measured against the session time spent on it;
+    the total line is measured against wall time, which is what parallelism improves.
+    """
+    if not jobs:
+        return
+    stats = defaultdict(lambda: [0, 0.0])
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_job, driver, items) for items in jobs]
+        for future in as_completed(futures):
+            for desc, count, elapsed in future.result():
+                stats[desc][0] += count
+                stats[desc][1] += elapsed
+    wall = time.perf_counter() - start
+
+    for desc, (count, elapsed) in stats.items():
+        rate = count / elapsed if elapsed > 0 else float("inf")
+        tqdm.write(f"  {desc}: {count} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    total = sum(count for count, _ in stats.values())
+    rate = total / wall if wall > 0 else float("inf")
+    tqdm.write(f"  Total: {total} rows in {wall:.2f}s on {workers} session(s) ({rate:,.0f} rows/sec)")
+
+def partition_by_endpoints(rel_rows, workers):
+    """
+    Buckets relationship rows by a stable hash of one endpoint: the one with fewer edges (ties broken
+    by label and name). Every edge of a hub node (e.g. a popular Trend) is therefore spread by its other
+    endpoint across all sessions, while a low-degree node keeps its edges on one session. Sessions that
+    still meet on a hub are handled by execute_write's deadlock retries, and rows within a group are
+    sorted by (source, target) so locks are always taken in the same order.
+    Returns one dict of group -> rows per bucket.
+    """
+    degree = Counter()
+    for (relation_type, source_label, target_label), rows in rel_rows.items():
+        for row in rows:
+            degree[(source_label, str(row["source"]))] += 1
+            degree[(target_label, str(row["target"]))] += 1
+
+    buckets = [defaultdict(list) for _ in range(workers)]
+    for group, rows in rel_rows.items():
+        relation_type, source_label, target_label = group
+        for row in rows:
+            endpoints = [(source_label, str(row["source"])), (target_label, str(row["target"]))]
+            label, name = min(endpoints, key=lambda endpoint: (degree[endpoint], endpoint))
+            buckets[zlib.crc32(f"{label}\x00{name}".encode("utf-8")) % workers][group].append(row)
+    for bucket in buckets:
+        for rows in bucket.values():
+            rows.sort(key=lambda row: (str(row["source"]), str(row["target"])))
+    return buckets
+
+def write_groups(driver, node_rows, rel_rows, batch_size=BATCH_SIZE, workers=WORKERS):
+    """Writes grouped node and relationship rows with batched UNWIND statements on parallel sessions."""
+    # Names are unique within a label after deduplication, so node batches never share a node
+    # and each one can run on its own session. The last sentiment wins, as it did row by row.
+    node_jobs = []
+    for label, rows in node_rows.items():
+        unique_rows = list({row["name"]: row for row in rows}.values())
+        node_jobs.extend([batch] for batch in make_batches(f":{label}", node_query(label), unique_rows, batch_size))
+    print("Writing nodes...")
+    run_jobs(driver, node_jobs, workers)
+
+    rel_jobs = []
+    for bucket in partition_by_endpoints(rel_rows, workers):
+        items = []
+        for (relation_type, source_label, target_label), rows in bucket.items():
+            query = "UNWIND $rows AS row" + relationship_query(relation_type, source_label, target_label)
+            items.extend(make_batches(f"(:{source_label})-[:{relation_type}]->(:{target_label})", query, rows, batch_size))
+        if items:
+            rel_jobs.append(items)
+    print("Writing relationships...")
+    run_jobs(driver, rel_jobs, workers)
+
+    total_nodes = sum(len(rows) for rows in node_rows.values())
+    total_relationships = sum(len(rows) for rows in rel_rows.values())
+    return total_nodes, total_relationships
+
+def bulk_load(driver, node_rows, rel_rows, batch_size=BATCH_SIZE, workers=WORKERS):
+    """Uploads collected rows with batched UNWIND statements grouped by node label and relationship type."""
+    return write_groups(driver, node_rows, rel_rows, batch_size, workers)
+
+def fingerprint(obj):
+    """MD5 of the canonical JSON form of a document or row."""
+    return hashlib.md5(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def build_row_state(node_rows, rel_rows):
+    """
+    Flattens grouped rows into {row_key: fingerprint}.
+    Keys are JSON lists so removed rows can be turned back into DELETE parameters.
+    Later rows for the same node overwrite earlier ones, matching the SET order in Neo4j.
+    """
+    row_state = {}
+    for label, rows in node_rows.items():
+        for row in rows:
+            row_state[json.dumps(["N", label, row["name"]])] = fingerprint(row)
+    for (relation_type, source_label, target_label), rows in rel_rows.items():
+        for row in rows:
+            row_state[json.dumps(["R", relation_type, source_label, target_label, row["source"], row["target"]])] = fingerprint(row)
+    return row_state
+
+def save_delta_state(data, node_rows, rel_rows):
+    """Records every document and row as applied, so the next delta run starts from here."""
+    CheckpointManager(DELTA_STATE_NAME, FINAL_KG_PATH).save_state({
+        "documents": sorted({fingerprint(item) for item in data}),
+        "rows": build_row_state(node_rows, rel_rows)
+    })
+
+def delete_rows(driver, row_keys, batch_size=BATCH_SIZE, workers=WORKERS):
+    """Deletes relationships first, then nodes, for rows that disappeared from the source file."""
+    node_deletes = defaultdict(list)
+    rel_deletes = defaultdict(list)
+    for key in row_keys:
+        parts = json.loads(key)
+        if parts[0] == "N":
+            node_deletes[parts[1]].append({"name": parts[2]})
+        else:
+            rel_deletes[tuple(parts[1:4])].append({"source": parts[4], "target": parts[5]})
+
+    print("Deleting removed rows...")
+    rel_jobs = []
+    for bucket in partition_by_endpoints(rel_deletes, workers):
+        items = []
+        for (relation_type, source_label, target_label), rows in bucket.items():
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (s:`{source_label}` {{name: row.source}})-[r:`{relation_type}`]->(t:`{target_label}` {{name: row.target}})
+            DELETE r
+            """
+            items.extend(make_batches(f"-(:{source_label})-[:{relation_type}]->(:{target_label})", query, rows, batch_size))
+        if items:
+            rel_jobs.append(items)
+    run_jobs(driver, rel_jobs, workers)
+
+    node_jobs = []
+    for label, rows in node_deletes.items():
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (n:`{label}` {{name: row.name}})
+        DETACH DELETE n
+        """
+        node_jobs.extend([batch] for batch in make_batches(f"-:{label}", query, rows, batch_size))
+    run_jobs(driver, node_jobs, workers)
+
+def delta_load(driver, data, batch_size=BATCH_SIZE, prune=False, workers=WORKERS):
+    """
+    Pushes only the rows that were added or changed since the last applied state.
+    With prune=True, rows that disappeared from the source file are deleted from Neo4j as well.
+    """
+    checkpoint_mgr = CheckpointManager(DELTA_STATE_NAME, FINAL_KG_PATH)
+    previous = checkpoint_mgr.load_state()
+    previous_docs = set(previous.get("documents", []))
+    previous_rows = previous.get("rows", {})
+
+    doc_fingerprints = {fingerprint(item) for item in data}
+    added_docs = len(doc_fingerprints - previous_docs)
+    removed_docs = len(previous_docs - doc_fingerprints)
+    print(f"Delta: {added_docs} new/changed documents, {removed_docs} removed documents since last upload.")
+    if not added_docs and not removed_docs and previous_rows:
+        print("✅ Neo4j is already up to date with this source file.")
+        return 0, 0
+
+    node_rows, rel_rows = collect_rows(data)
+    current_rows = build_row_state(node_rows, rel_rows)
+    changed = {key for key, fp in current_rows.items() if previous_rows.get(key) != fp}
+    removed = set(previous_rows) - set(current_rows)
+    print(f"Delta: {len(changed)} rows to write, {len(removed)} rows no longer in the source file.")
+
+    if prune and removed:
+        delete_rows(driver, removed, batch_size, workers)
+
+    delta_nodes = defaultdict(list)
+    for label, rows in node_rows.items():
+        for row in rows:
+            if json.dumps(["N", label, row["name"]]) in changed:
+                delta_nodes[label].append(row)
+    delta_rels = defaultdict(list)
+    for group, rows in rel_rows.items():
+        for row in rows:
+            if json.dumps(["R", *group, row["source"], row["target"]]) in changed:
+                delta_rels[group].append(row)
+
+    total_nodes, total_relationships = write_groups(driver, delta_nodes, delta_rels, batch_size, workers)
+
+    # Without pruning the removed rows still exist in Neo4j, so keep tracking them
+    applied_rows = current_rows if prune else {**previous_rows, **current_rows}
+    checkpoint_mgr.save_state({
+        "documents": sorted(doc_fingerprints),
+        "rows": applied_rows
+    })
+    return total_nodes, total_relationships
+
+def row_load(session, node_rows, rel_rows):
+    """Original one-query-per-row upload of collected rows. Kept for debugging individual rows."""
+    total_nodes = 0
+    total_relationships = 0
+
+    with tqdm(total=sum(map(len, node_rows.values())) + sum(map(len, rel_rows.values())), desc="Uploading to Neo4j", unit="row") as pbar:
+        # Nodes: MERGE the node based on name, dynamically assign label based on type
+        for label, rows in node_rows.items():
+            query = f"""
+            MERGE (n:`{label}` {{name: $name}})
+            SET n.sentiment = $sentiment
+            """
+            for row in rows:
+                session.run(query, **row)
+                total_nodes += 1
+                pbar.update(1)
+
+        # Relationships: MATCH source and target by label and name, MERGE relationship
+        for (relation_type, source_label, target_label), rows in rel_rows.items():
+            query = relationship_query(relation_type, source_label, target_label, prefix="$")
+            for row in rows:
+                session.run(query, **row)
+                total_relationships += 1
+                pbar.update(1)
+
+    return total_nodes, total_relationships
+
+def ingest_data(mode="delta", batch_size=BATCH_SIZE, prune=False, workers=WORKERS):
     if not all([NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD]):
         print("Missing Neo4j credentials in config/environment variables.")
         return
 
-    # Checkpoint logic
+    # Checkpoint logic (delta mode tracks its own per-row state instead)
     checkpoint_mgr = CheckpointManager("neo4j_upload", FINAL_KG_PATH)
-    if checkpoint_mgr.load_checkpoint() >= 100:  # Use 100 as 'completed' flag or total count
+    if mode != "delta" and checkpoint_mgr.load_checkpoint() >= 100:  # Use 100 as 'completed' flag or total count
         print("✅ Neo4j upload already marked as complete for this source file. Skipping.")
         return
 
     # Initialize Neo4j driver connection
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-    
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD), max_connection_pool_size=max(workers, 100))
+
     file_path = FINAL_KG_PATH
     try:
         with open(file_path, "r", encoding="utf-8") as f:
@@ -26,68 +395,33 @@ def ingest_data():
     except FileNotFoundError:
         print(f"File not found: {file_path}")
         return
-        
-    total_nodes = 0
-    total_relationships = 0
 
     try:
+        # Full loads collect the rows once, for the upload and for the delta state saved after it
+        if mode != "delta":
+            node_rows, rel_rows = collect_rows(data)
+
         with driver.session() as session:
-            for item in tqdm(data, desc="Uploading to Neo4j", unit="item"):
-                entities = item.get("entities", [])
-                relationships = item.get("relationships", [])
-                
-                # Nodes: MERGE the node based on name, dynamically assign label based on type
-                for entity in entities:
-                    name = entity.get("name")
-                    # Clean up the type to be a valid label
-                    label = str(entity.get("type", "Entity")).replace(" ", "_").replace("-", "_")
-                    if not label:
-                        label = "Entity"
-                    sentiment = entity.get("sentiment", "neutral")
-                    
-                    if not name:
-                        continue
-                        
-                    if label not in SCHEMA_CONFIG["NODE_LABELS"]:
-                        print(f"Skipping node '{name}': Label '{label}' not in allowed schema.")
-                        continue
-                        
-                    query = f"""
-                    MERGE (n:`{label}` {{name: $name}})
-                    SET n.sentiment = $sentiment
-                    """
-                    session.run(query, name=name, sentiment=sentiment)
-                    total_nodes += 1
-                
-                # Relationships: MATCH source and target by name, MERGE relationship
-                for rel in relationships:
-                    source = rel.get("source")
-                    target = rel.get("target")
-                    # Clean up the relation to be a valid cypher relation type
-                    relation_type = str(rel.get("relation", "RELATED_TO")).replace(" ", "_").replace("-", "_").upper()
-                    if not relation_type:
-                        relation_type = "RELATED_TO"
-                        
-                    if not source or not target:
-                        continue
-                        
-                    if relation_type not in SCHEMA_CONFIG["RELATIONSHIP_TYPES"]:
-                        print(f"Skipping relation {source}-[{relation_type}]->{target}: Type not in allowed schema.")
-                        continue
-                        
-                    query = f"""
-                    MATCH (s {{name: $source}})
-                    MATCH (t {{name: $target}})
-                    MERGE (s)-[r:`{relation_type}`]->(t)
-                    """
-                    session.run(query, source=source, target=target)
-                    total_relationships += 1
-                    
+            create_constraints(session)
+            if mode == "row":
+                total_nodes, total_relationships = row_load(session, node_rows, rel_rows)
+
+        if mode == "delta":
+            print(f"Delta loading with batch size {batch_size} on {workers} session(s)...")
+            total_nodes, total_relationships = delta_load(driver, data, batch_size, prune, workers)
+        elif mode == "bulk":
+            print(f"Bulk loading with batch size {batch_size} on {workers} session(s)...")
+            total_nodes, total_relationships = bulk_load(driver, node_rows, rel_rows, batch_size, workers)
+
+        if mode != "delta":
+            # A full load applies every row, so later delta runs can start from it
+            save_delta_state(data, node_rows, rel_rows)
+
         print(f"Successfully processed {len(data)} items.")
-        print(f"Total node MERGE queries executed: {total_nodes}")
-        print(f"Total relationship MERGE queries executed: {total_relationships}")
+        print(f"Total node MERGE rows executed: {total_nodes}")
+        print(f"Total relationship MERGE rows executed: {total_relationships}")
         checkpoint_mgr.save_checkpoint(100) # Mark as complete
-        
+
     except Exception as e:
         print(f"An error occurred during ingestion: {e}")
     finally:
@@ -104,4 +438,10 @@ def init_chromadb():
     pass
 
 if __name__ == "__main__":
-    ingest_data()
+    parser = argparse.ArgumentParser(description="Upload the resolved knowledge graph to Neo4j")
+    parser.add_argument("--mode", choices=["delta", "bulk", "row"], default="delta", help="delta: only rows changed since the last upload (default); bulk: batched UNWIND writes of everything; row: one query per node/relationship")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Rows per UNWIND batch (default: {BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"Parallel writer sessions for delta/bulk mode (default: {WORKERS})")
+    parser.add_argument("--prune", action="store_true", help="In delta mode, also delete nodes/relationships that were removed from the source file")
+    args = parser.parse_args()
+    ingest_data(mode=args.mode, batch_size=args.batch_size, prune=args.prune, workers=max(1, args.workers))
@@ -1,119 +1,115 @@
 import pandas as pd
 import chromadb
-import hashlib
 import os
 from config import MASTER_DATASET_PATH, CHROMA_DB_PATH, REDDIT_CLEANED_CSV_PATH, TECHCRUNCH_CLEANED_CSV_PATH, STARTUPS_GALLERY_CLEANED_CSV_PATH, JOBBOARDS_CLEANED_CSV_PATH, YCOMBINATOR_CLEANED_CSV_PATH
-from CODE.utilities.checkpoint_manager import CheckpointManager
+from CODE.utilities.vector_sync import sync_collection
+from CODE.utilities.chunker import chunk_records
+from CODE.utilities.embeddings import LocalEmbedder
 
-def generate_id(url, index):
-    if url:
-        return hashlib.md5(str(url).encode('utf-8')).hexdigest() + f"_{index}"
-    return f"post_{index}"
+# Metadata fields every document gets (column, default when the column is missing)
+BASE_FIELDS = [
+    ("author_name", "Name", ""),
+    ("authors", "Name", ""),
+    ("profile_url", "Link to profile", ""),
+    ("post_url", "Link to post", ""),
+    ("source_topic", "source_topic", ""),
+    ("source", "source", "LinkedIn"),
+    ("keywords", "keywords", "")
+]
+# Fields only set on documents that have a value for them
+OPTIONAL_FIELDS = ['chunk_id', 'investors', 'funding_amount', 'funding_amount_pretty', 'funding_stage']
+JOB_FIELDS = ['job_title', 'location', 'role_category', 'company', 'employment_type', 'salary_normalized', 'salary_min', 'salary_max', 'salary_currency']
 
-def main():
-    # Checkpoint logic
-    checkpoint_mgr = CheckpointManager("vector_upload", MASTER_DATASET_PATH)
+def load_csv(path):
+    """Reads one cleaned CSV the way every upload path does, so they all produce the same metadata for a row."""
+    return pd.read_csv(path).astype(object).fillna('')
+
+def column(df, name, default=''):
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index, dtype=object)
+
+def prepare_documents(df):
+    """
+    Builds the documents and metadata for a frame that was already .astype(object).fillna('').
+    Works column by column: each field is converted once for the whole frame, and optional fields are
+    only written into the records that have a value for them.
+    """
+    content = column(df, 'Post content')
+    docs = content.where(content.map(bool), column(df, 'clean_content')).astype(str).tolist()
+
+    base = pd.DataFrame({field: column(df, name, default).astype(str) for field, name, default in BASE_FIELDS})
+    metadatas = base.to_dict('records')
 
+    optional = []
+    if 'importance' in df.columns:
+        values = df['importance']
+        mask = (values != '').to_numpy()
+        optional.append(('importance', mask, values[mask].astype(float).tolist()))
+    for field in OPTIONAL_FIELDS:
+        if field in df.columns:
+            values = df[field]
+            mask = (values != '').to_numpy()
+            optional.append((field, mask, values[mask].astype(str).tolist()))
+    for field in JOB_FIELDS:
+        if field in df.columns:
+            values = df[field].astype(str)
+            mask = (values.str.strip() != '').to_numpy()
+            optional.append((field, mask, values[mask].tolist()))
+
+    for field, mask, values in optional:
+        for i, value in zip(mask.nonzero()[0], values):
+            metadatas[i][field] = value
+    return docs, metadatas
+
+def main():
     print("Loading data...")
     dfs = []
     if os.path.exists(MASTER_DATASET_PATH):
-        dfs.append(pd.read_csv(MASTER_DATASET_PATH))
+        dfs.append(load_csv(MASTER_DATASET_PATH))
     if os.path.exists(REDDIT_CLEANED_CSV_PATH):
-        dfs.append(pd.read_csv(REDDIT_CLEANED_CSV_PATH))
+        dfs.append(load_csv(REDDIT_CLEANED_CSV_PATH))
     if os.path.exists(TECHCRUNCH_CLEANED_CSV_PATH):
-        dfs.append(pd.read_csv(TECHCRUNCH_CLEANED_CSV_PATH))
+        dfs.append(load_csv(TECHCRUNCH_CLEANED_CSV_PATH))
     if os.path.exists(STARTUPS_GALLERY_CLEANED_CSV_PATH):
-        dfs.append(pd.read_csv(STARTUPS_GALLERY_CLEANED_CSV_PATH))
+        dfs.append(load_csv(STARTUPS_GALLERY_CLEANED_CSV_PATH))
     if os.path.exists(JOBBOARDS_CLEANED_CSV_PATH):
-        dfs.append(pd.read_csv(JOBBOARDS_CLEANED_CSV_PATH))
+        dfs.append(load_csv(JOBBOARDS_CLEANED_CSV_PATH))
     if os.path.exists(YCOMBINATOR_CLEANED_CSV_PATH):
-        dfs.append(pd.read_csv(YCOMBINATOR_CLEANED_CSV_PATH))
+        dfs.append(load_csv(YCOMBINATOR_CLEANED_CSV_PATH))
         
     if not dfs:
         print("No datasets found.")
         return
         
+    # Each file is converted on its own, so a column's values do not depend on which other files are present
     df = pd.concat(dfs, ignore_index=True)
-    df = df.astype(object).fillna('')
+    df = df.fillna('')
     
     print("Initializing ChromaDB...")
     # Init ChromaDB
     chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
     collection = chroma_client.get_or_create_collection(name="market_intelligence")
     
-    docs = []
-    metadatas = []
-    ids = []
-    
     print("Preparing documents for ingestion...")
-    for idx, row in df.iterrows():
-        content = row.get('Post content', '')
-        if not content:
-            content = row.get('clean_content', '')
-            
-        docs.append(str(content))
-        
-        meta = {
-            "author_name": str(row.get('Name', '')),
-            "authors": str(row.get('Name', '')),
-            "profile_url": str(row.get('Link to profile', '')),
-            "post_url": str(row.get('Link to post', '')),
-            "source_topic": str(row.get('source_topic', '')),
-            "source": str(row.get('source', 'LinkedIn')),
-            "keywords": str(row.get('keywords', ''))
-        }
-        
-        if 'importance' in row and row['importance'] != '':
-            meta['importance'] = float(row['importance'])
-        if 'chunk_id' in row and row['chunk_id'] != '':
-            meta['chunk_id'] = str(row['chunk_id'])
-            
-        if 'investors' in row and row['investors'] != '':
-            meta['investors'] = str(row['investors'])
-        if 'funding_amount' in row and row['funding_amount'] != '':
-            meta['funding_amount'] = str(row['funding_amount'])
-        if 'funding_amount_pretty' in row and row['funding_amount_pretty'] != '':
-            meta['funding_amount_pretty'] = str(row['funding_amount_pretty'])
-        if 'funding_stage' in row and row['funding_stage'] != '':
-            meta['funding_stage'] = str(row['funding_stage'])
-            
-        # Job-specific fields loop
-        job_fields = ['job_title', 'location', 'role_category', 'company', 'employment_type', 'salary_normalized', 'salary_min', 'salary_max', 'salary_currency']
-        for field in job_fields:
-            if field in row and pd.notna(row[field]) and str(row[field]).strip() != '':
-                meta[field] = str(row[field])
-            
-        metadatas.append(meta)
-        
-        post_id = generate_id(row.get('Link to post', ''), idx)
-        ids.append(post_id)
+    docs, metadatas = prepare_documents(df)
+    # Long articles are indexed as overlapping chunks that point back to their document
+    docs, metadatas, ids = chunk_records(docs, metadatas)
         
-    print(f"Total documents to ingest: {len(docs)}")
-    
-    # Safe Checkpoint validation
-    last_count = checkpoint_mgr.load_checkpoint()
-    if last_count == len(docs):
-        print(f"✅ Vector store already has all {len(docs)} documents. Skipping.")
-        return
-    
-    # Batch Upsert. ChromaDB handles small to medium datasets fine, but we chunk to 5461 which is a safe limit.
-    batch_size = 1000
-    for i in range(0, len(docs), batch_size):
-        end_idx = min(i + batch_size, len(docs))
-        collection.upsert(
-            documents=docs[i:end_idx],
-            metadatas=metadatas[i:end_idx],
-            ids=ids[i:end_idx]
-        )
-        print(f"Upserted items {i} to {end_idx - 1}")
+    print(f"Total chunks to ingest: {len(docs)} from {len({m['parent_id'] for m in metadatas})} documents")
     
-    print("Ingestion complete!")
-    checkpoint_mgr.save_checkpoint(len(docs))
+    # Diff against what the collection already holds: only new documents are embedded, locally and through the cache.
+    # Only the sources in these files are synced, so sources added through ingestion_template.py are left alone
+    embedder = LocalEmbedder()
+    sources = sorted({m['source'] for m in metadatas})
+    counts = sync_collection(collection, docs, metadatas, ids, where={"source": {"$in": sources}}, embed=embedder)
+    print(f"Ingestion complete! {counts['embedded']} embedded, {counts['updated']} metadata updated, "
+          f"{counts['deleted']} stale removed, {counts['unchanged']} unchanged.")
     
     # Test Query
     print("\n--- Test Query: 'AI Startups' ---")
     results = collection.query(
-        query_texts=["AI Startups"],
+        query_embeddings=embedder(["AI Startups"]),
         n_results=2
     )
     
@@ -13,20 +13,16 @@ Instructions:
 """
 
 import pandas as pd
-import hashlib
 
 # TODO: If this script needs to speak to the LLM, use our standard utility:
 # from utils.llm_client import get_llm
 
 from config import CHROMA_DB_PATH
+from CODE.utilities.vector_sync import sync_collection
+from CODE.utilities.chunker import chunk_records
+from CODE.utilities.embeddings import LocalEmbedder
 import chromadb
 
-def generate_id(unique_identifier, index):
-    """Generates a stable ID for vector DB upserts."""
-    if unique_identifier:
-        return hashlib.md5(str(unique_identifier).encode('utf-8')).hexdigest() + f"_{index}"
-    return f"record_{index}"
-
 def clean_data(file_path):
     """
     TODO: Implement your specific CSV parsing/cleaning logic here.
@@ -50,7 +46,6 @@ def push_to_vector_store(df, source_name):
 
     docs = []
     metadatas = []
-    ids = []
 
     for idx, row in df.iterrows():
         # TODO: Define the primary text blob
@@ -67,22 +62,16 @@ def push_to_vector_store(df, source_name):
             "source": source_name # e.g. "TechCrunch", "Reddit"
         }
         
-        doc_id = generate_id(row.get('source_url', ''), idx)
-
         docs.append(str(content))
         metadatas.append(meta)
-        ids.append(doc_id)
 
-    # Batch Upsert Loop (safest for large datasets)
-    batch_size = 1000
-    for i in range(0, len(docs), batch_size):
-        end_idx = min(i + batch_size, len(docs))
-        collection.upsert(
-            documents=docs[i:end_idx],
-            metadatas=metadatas[i:end_idx],
-            ids=ids[i:end_idx]
-        )
-        print(f"Upserted items {i} to {end_idx - 1} from {source_name}")
+    # Split long texts into overlapping chunks with content-addressed IDs (parent_id links them to their record)
+    docs, metadatas, ids = chunk_records(docs, metadatas)
+
+    # Sync this source only: new records are embedded, changed metadata updated, removed records deleted
+    # Embeddings come from the shared local backend (config.EMBEDDING_MODEL_NAME), never from Chroma's default
+    counts = sync_collection(collection, docs, metadatas, ids, where={"source": source_name}, embed=LocalEmbedder())
+    print(f"Synced {len(docs)} records from {source_name}: {counts}")
 
 if __name__ == "__main__":
     # TODO: Replace with your actual path 
@@ -0,0 +1,118 @@
+"""
+Embedding tier for entity resolution.
+
+String similarity never proposes pairs like "Meta" / "Facebook", and it sends every fuzzy-but-different
+pair to the LLM. This tier encodes each unique name once with a local sentence-transformers model
+(vectors cached on disk) and uses an in-memory HNSW index to propose new pairs between canonical names
+whose embeddings are close. Proposed pairs always go to the LLM.
+
+Optionally (decide_locally), string-similar pairs whose cosine similarity is clearly high or clearly low
+are decided without the LLM. This is off by default: merges cannot be undone, and the thresholds have not
+been validated against the extracted names (MiniLM scores short variants like "GPT-3" / "GPT-4" very high).
+"""
+import uuid
+
+import chromadb
+from tqdm import tqdm
+
+from config import EMBEDDING_CACHE_PATH
+from utilities.embeddings import EmbeddingCache
+from utilities.pair_store import pair_key
+from processing.entity_matching import compatible_types
+
+# Cosine similarity thresholds
+EMBEDDING_MERGE_THRESHOLD = 0.95    # string-similar pair decided locally as the same entity (decide_locally only)
+EMBEDDING_PROPOSE_THRESHOLD = 0.80  # new pair proposed to the LLM
+EMBEDDING_REJECT_THRESHOLD = 0.40   # string-similar pair decided locally as different (decide_locally only)
+EMBEDDING_NEIGHBORS = 5
+
+class NameIndex:
+    """Approximate nearest-neighbour index over normalized name vectors (Chroma's HNSW, kept in memory)."""
+
+    def __init__(self, vectors):
+        self.client = chromadb.EphemeralClient()
+        self.collection = self.client.create_collection(name=f"names-{uuid.uuid4().hex[:12]}", metadata={"hnsw:space": "cosine"})
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            self.collection.add(ids=[str(start + i) for i in range(len(batch))], embeddings=batch.tolist())
+
+    def neighbors(self, vectors, k):
+        """Yields (row, neighbour row, cosine similarity) for the k nearest neighbours of every row."""
+        batch_size = 512
+        for start in range(0, len(vectors), batch_size):
+            result = self.collection.query(
+                query_embeddings=vectors[start:start + batch_size].tolist(),
+                n_results=min(k + 1, len(vectors)),
+                include=["distances"]
+            )
+            for offset, (ids, distances) in enumerate(zip(result["ids"], result["distances"])):
+                row = start + offset
+                for neighbor, distance in zip(ids, distances):
+                    if int(neighbor) != row:
+                        yield row, int(neighbor), 1.0 - distance
+
+    def close(self):
+        self.client.delete_collection(self.collection.name)
+
+def embedding_decision(e1, e2, similarity, is_same):
+    """Same shape as an LLM decision, so it can be applied and clustered the same way."""
+    return {
+        "is_same": is_same,
+        "canonical_name": None,
+        "e1": e1,
+        "e2": e2,
+        "similarity": round(float(similarity), 4),
+        "decided_by": "embedding"
+    }
+
+def embedding_tier(canonical_names, uncertain_pairs, name_types=None, decide_locally=False):
+    """
+    Proposes new pairs between canonical names whose embeddings are close (only between compatible types
+    when `name_types` is given). With `decide_locally`, also decides clear-cut string-similar pairs of the same type.
+    Returns (local_decisions, proposed_pairs): local_decisions maps pair_key -> decision for pairs that
+    no longer need the LLM (empty unless decide_locally); proposed_pairs are new (e1, e2) pairs for the LLM.
+    """
+    names = sorted(set(canonical_names).union(*map(set, uncertain_pairs)))
+    row_of = {name: i for i, name in enumerate(names)}
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+    try:
+        vectors = cache.encode(names, show_progress=True)
+    finally:
+        cache.close()
+
+    local_decisions = {}
+    for e1, e2 in (uncertain_pairs if decide_locally else ()):
+        # Cross-type pairs (e.g. from the cross-type pass of resolve_partitioned) are left to the LLM
+        if name_types is not None and name_types.get(e1) != name_types.get(e2):
+            continue
+        similarity = float(vectors[row_of[e1]] @ vectors[row_of[e2]])
+        if similarity >= EMBEDDING_MERGE_THRESHOLD:
+            local_decisions[pair_key(e1, e2)] = embedding_decision(e1, e2, similarity, True)
+        elif similarity <= EMBEDDING_REJECT_THRESHOLD:
+            local_decisions[pair_key(e1, e2)] = embedding_decision(e1, e2, similarity, False)
+
+    # New candidates only come from canonical names; Phase 1 already merged everything else into them
+    canonical = sorted(set(canonical_names))
+    canonical_rows = [row_of[name] for name in canonical]
+    string_pairs = {pair_key(e1, e2) for e1, e2 in uncertain_pairs}
+    proposed = {}
+    index = NameIndex(vectors[canonical_rows])
+    try:
+        for i, j, similarity in tqdm(index.neighbors(vectors[canonical_rows], EMBEDDING_NEIGHBORS), desc="Embedding neighbours", total=len(canonical) * EMBEDDING_NEIGHBORS):
+            if similarity < EMBEDDING_PROPOSE_THRESHOLD:
+                continue
+            e1, e2 = canonical[i], canonical[j]
+            if name_types is not None and not compatible_types(name_types.get(e1), name_types.get(e2)):
+                continue
+            key = pair_key(e1, e2)
+            # Pairs with no string similarity are never decided locally, however close their embeddings
+            if key not in string_pairs:
+                proposed.setdefault(key, (e1, e2))
+    finally:
+        index.close()
+
+    merged = sum(1 for d in local_decisions.values() if d["is_same"])
+    print(f"Embedding tier: {merged:,} pairs merged and {len(local_decisions) - merged:,} rejected locally, "
+          f"{len(proposed):,} new pairs proposed to the LLM.")
+    return local_decisions, list(proposed.values())
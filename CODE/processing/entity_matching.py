@@ -0,0 +1,369 @@
+"""
+Local (non-LLM) matching for entity resolution Phase 1.
+
+Phase 1 walks names longest-first and compares each one against the canonical names found so far.
+Instead of comparing against every canonical name, the blocking index only returns canonical names
+that share at least one block with the incoming name:
+- a prefix block (first PREFIX_LEN characters), since Jaro-Winkler rewards shared prefixes,
+- a phonetic block (metaphone of the first word),
+- MinHash LSH bands over character 3-grams, for similar names that differ early on.
+Candidates are returned in the same order as the brute-force scan, so a name only resolves differently
+when blocking missed the canonical name it would have matched.
+
+Candidate lists are then shortlisted by SimilarityKernel, which bounds Jaro-Winkler for a whole batch of
+canonical names at once with NumPy. The bound never underestimates, so only pairs that provably stay below
+UNCERTAIN_THRESHOLD are dropped and Phase 1 output is unchanged.
+"""
+import os
+import re
+import time
+import random
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import jellyfish
+import numpy as np
+from tqdm import tqdm
+
+# Phase 1 thresholds
+AUTO_MERGE_THRESHOLD = 0.98
+UNCERTAIN_THRESHOLD = 0.85
+MAX_LENGTH_DIFF = 12
+
+# Blocking parameters
+PREFIX_LEN = 4
+SHINGLE_SIZE = 3
+LSH_BANDS = 20
+LSH_ROWS = 2
+
+# Similarity kernel parameters
+HISTOGRAM_BINS = 64
+WINKLER_PREFIX = 4
+WINKLER_SCALE = 0.1
+KERNEL_MIN_BATCH = 64  # below this, calling jellyfish directly is cheaper than the NumPy round trip
+
+# Type partitions: names are only compared within their type, plus these known ambiguous type pairs.
+# Untyped names may be any type, so they are paired with every partition.
+CROSS_TYPE_GROUPS = [("Organization", "Investor"), ("Technology", "Trend"), ("Technology", "Skill")]
+UNKNOWN_TYPE = "Unknown"
+PARTITION_WORKERS = min(4, os.cpu_count() or 1)
+PARALLEL_MIN_NAMES = 5000  # below this, starting worker processes costs more than resolving in-process
+
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+# A 31-bit prime keeps a * h + b inside uint64, so all hash functions run as one NumPy expression
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = random.Random(573)
+_HASH_A = np.array([_rng.randrange(1, _MERSENNE_PRIME) for _ in range(LSH_BANDS * LSH_ROWS)], dtype=np.uint64)
+_HASH_B = np.array([_rng.randrange(0, _MERSENNE_PRIME) for _ in range(LSH_BANDS * LSH_ROWS)], dtype=np.uint64)
+
+def blocking_key(name):
+    """Lowercase, alphanumeric-only, single-spaced form used for every block."""
+    return " ".join(_NON_ALNUM.sub(" ", name.lower()).split())
+
+def shingles(key):
+    padded = f" {key} "
+    return {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+
+def minhash_signature(shingle_set):
+    # crc32 rather than hash(), which is salted per process and would change the blocks on every run
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _MERSENNE_PRIME for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return ((_HASH_A[:, None] * hashes + _HASH_B[:, None]) % _MERSENNE_PRIME).min(axis=1).tolist()
+
+def block_keys(name):
+    key = blocking_key(name)
+    keys = [("prefix", key[:PREFIX_LEN])]
+    first_word = key.split(" ", 1)[0]
+    if first_word:
+        keys.append(("phonetic", jellyfish.metaphone(first_word)))
+    signature = minhash_signature(shingles(key))
+    for band in range(LSH_BANDS):
+        keys.append(("lsh", band, *signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]))
+    return keys
+
+class BlockingIndex:
+    """Block key -> canonical names, filled incrementally as Phase 1 discovers new canonical names."""
+
+    def __init__(self):
+        self.blocks = defaultdict(list)
+        self.order = {}
+
+    def add(self, name, keys):
+        self.order[name] = len(self.order)
+        for key in keys:
+            self.blocks[key].append(name)
+
+    def candidates(self, keys):
+        """Canonical names sharing a block, in the order they became canonical."""
+        found = set()
+        for key in keys:
+            found.update(self.blocks.get(key, ()))
+        return sorted(found, key=self.order.__getitem__)
+
+def codepoints(text):
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+class SimilarityKernel:
+    """
+    Vectorized Jaro-Winkler upper bound over the canonical names found so far.
+    Each canonical name is stored as a row of character-bucket counts, its length and its first
+    WINKLER_PREFIX code points. Jaro can match at most sum(min(counts)) characters (sharing buckets only
+    loosens this), so jaro <= (m/len1 + m/len2 + 1) / 3, and the Winkler bonus is capped by the real
+    common prefix. Pairs whose bound is below UNCERTAIN_THRESHOLD can neither merge nor become uncertain.
+    jellyfish compares grapheme clusters rather than code points, so the bound is only applied between
+    printable-ASCII names, where the two coincide; any other pair always goes to jellyfish.
+    """
+
+    def __init__(self, capacity=1024):
+        self.rows = {}
+        self.size = 0
+        self.histograms = np.zeros((capacity, HISTOGRAM_BINS), dtype=np.int32)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.raw_lengths = np.zeros(capacity, dtype=np.int32)
+        self.prefixes = np.full((capacity, WINKLER_PREFIX), -1, dtype=np.int64)
+        self.ascii = np.zeros(capacity, dtype=bool)
+        self.pruned = 0
+
+    def _encode(self, name_lower, pad):
+        points = codepoints(name_lower)
+        histogram = np.bincount(points % HISTOGRAM_BINS, minlength=HISTOGRAM_BINS)
+        prefix = np.full(WINKLER_PREFIX, pad, dtype=np.int64)
+        prefix[:min(WINKLER_PREFIX, len(points))] = points[:WINKLER_PREFIX]
+        is_ascii = bool(len(points)) and 32 <= int(points.min()) and int(points.max()) <= 126
+        return histogram, len(points), prefix, is_ascii
+
+    def add(self, name, name_lower):
+        if self.size == len(self.lengths):
+            grow = len(self.lengths)
+            self.histograms = np.concatenate([self.histograms, np.zeros_like(self.histograms[:grow])])
+            self.lengths = np.concatenate([self.lengths, np.zeros_like(self.lengths[:grow])])
+            self.raw_lengths = np.concatenate([self.raw_lengths, np.zeros_like(self.raw_lengths[:grow])])
+            self.prefixes = np.concatenate([self.prefixes, np.full_like(self.prefixes[:grow], -1)])
+            self.ascii = np.concatenate([self.ascii, np.zeros_like(self.ascii[:grow])])
+        histogram, length, prefix, is_ascii = self._encode(name_lower, pad=-1)
+        row = self.size
+        self.histograms[row] = histogram
+        self.lengths[row] = length
+        self.raw_lengths[row] = len(name)
+        self.prefixes[row] = prefix
+        self.ascii[row] = is_ascii
+        self.rows[name] = row
+        self.size += 1
+
+    def upper_bounds(self, name_lower, rows):
+        # Pad with -2 so a short query never "matches" the -1 padding of a short canonical name
+        histogram, length, prefix, is_ascii = self._encode(name_lower, pad=-2)
+        if not is_ascii:
+            return np.full(len(rows), np.inf)
+        matches = np.minimum(self.histograms[rows], histogram).sum(axis=1)
+        jaro = (matches / max(1, length) + matches / np.maximum(1, self.lengths[rows]) + 1) / 3
+        jaro = np.where(matches > 0, jaro, 0.0)
+        common_prefix = np.cumprod(self.prefixes[rows] == prefix, axis=1).sum(axis=1)
+        bounds = jaro + common_prefix * WINKLER_SCALE * (1 - jaro)
+        return np.where(self.ascii[rows], bounds, np.inf)
+
+    def shortlist(self, name, name_lower, candidates):
+        """
+        Canonical names from `candidates` (kept in order) that pass the length filter and could still
+        score >= UNCERTAIN_THRESHOLD. Short lists skip the bound, since NumPy overhead would dominate.
+        """
+        if len(candidates) < KERNEL_MIN_BATCH:
+            return [c for c in candidates if abs(len(name) - len(c)) <= MAX_LENGTH_DIFF]
+        if len(candidates) == self.size:
+            rows = np.arange(self.size)  # brute force: candidates are every canonical name, in row order
+        else:
+            rows = np.fromiter((self.rows[c] for c in candidates), dtype=np.int64, count=len(candidates))
+        keep = np.abs(self.raw_lengths[rows] - len(name)) <= MAX_LENGTH_DIFF
+        bounds = self.upper_bounds(name_lower, rows[keep])
+        # The epsilon absorbs float rounding differences between NumPy and jellyfish at the threshold
+        survivors = np.flatnonzero(keep)[bounds >= UNCERTAIN_THRESHOLD - 1e-9]
+        self.pruned += int(keep.sum()) - len(survivors)
+        return [candidates[i] for i in survivors]
+
+def sort_names(names):
+    """Longest first (longer names often make better canonical names), ties broken alphabetically."""
+    return sorted(names, key=lambda n: (-len(n), n))
+
+def resolve_locally(names, use_blocking=True, use_kernel=True, desc=None):
+    """
+    Phase 1: maps every name to a canonical name using Jaro-Winkler similarity.
+    Pairs above AUTO_MERGE_THRESHOLD are merged; pairs in [UNCERTAIN_THRESHOLD, AUTO_MERGE_THRESHOLD]
+    are returned for the LLM. Returns (name_mapping, canonical_names, uncertain_pairs, comparisons),
+    where comparisons counts exact Jaro-Winkler calls.
+    """
+    name_mapping = {}
+    canonical_names = []
+    lowered = {}
+    uncertain_pairs = []
+    comparisons = 0
+    index = BlockingIndex() if use_blocking else None
+    kernel = SimilarityKernel() if use_kernel else None
+
+    desc = desc or "Resolving Entities Locally" + (" (blocked)" if use_blocking else " (brute force)")
+    for name in tqdm(sort_names(names), desc=desc):
+        if name in name_mapping:
+            continue
+
+        if index is not None:
+            keys = block_keys(name)
+            candidates = index.candidates(keys)
+        else:
+            candidates = canonical_names
+
+        name_lower = name.lower()
+        if kernel is not None:
+            candidates = kernel.shortlist(name, name_lower, candidates)
+        matched = False
+        # Only compare against existing canonical names
+        for c_name in candidates:
+            # Length difference optimization
+            if abs(len(name) - len(c_name)) > MAX_LENGTH_DIFF:
+                continue
+
+            comparisons += 1
+            sim = jellyfish.jaro_winkler_similarity(name_lower, lowered[c_name])
+
+            if sim > AUTO_MERGE_THRESHOLD:
+                name_mapping[name] = c_name
+                matched = True
+                break
+            elif UNCERTAIN_THRESHOLD <= sim <= AUTO_MERGE_THRESHOLD:
+                uncertain_pairs.append((name, c_name))
+
+        if not matched:
+            name_mapping[name] = name
+            canonical_names.append(name)
+            lowered[name] = name_lower
+            if index is not None:
+                index.add(name, keys)
+            if kernel is not None:
+                kernel.add(name, name_lower)
+
+    return name_mapping, canonical_names, uncertain_pairs, comparisons
+
+def majority_types(data):
+    """Name -> the type it is most often extracted with (ties alphabetical), so each name lives in one partition."""
+    counts = defaultdict(Counter)
+    for doc in data:
+        for ent in doc.get("entities", []):
+            if ent.get("name"):
+                counts[ent["name"]][ent.get("type") or UNKNOWN_TYPE] += 1
+    return {name: min(c.items(), key=lambda kv: (-kv[1], kv[0]))[0] for name, c in counts.items()}
+
+def compatible_types(type_1, type_2):
+    """True if names of these types may refer to the same entity."""
+    if UNKNOWN_TYPE in (type_1, type_2):
+        return True
+    return type_1 == type_2 or (type_1, type_2) in CROSS_TYPE_GROUPS or (type_2, type_1) in CROSS_TYPE_GROUPS
+
+def cross_type_pairs(left, right, use_blocking=True):
+    """
+    Pairs (left name, right name) scoring at least UNCERTAIN_THRESHOLD, for two canonical name sets of
+    different types. Nothing is merged automatically across types; every pair goes to the LLM.
+    """
+    index = BlockingIndex() if use_blocking else None
+    kernel = SimilarityKernel()
+    lowered = {}
+    for name in sort_names(right):
+        name_lower = name.lower()
+        lowered[name] = name_lower
+        kernel.add(name, name_lower)
+        if index is not None:
+            index.add(name, block_keys(name))
+
+    pairs = []
+    comparisons = 0
+    for name in sort_names(left):
+        candidates = index.candidates(block_keys(name)) if index is not None else list(lowered)
+        name_lower = name.lower()
+        for c_name in kernel.shortlist(name, name_lower, candidates):
+            if abs(len(name) - len(c_name)) > MAX_LENGTH_DIFF:
+                continue
+            comparisons += 1
+            if jellyfish.jaro_winkler_similarity(name_lower, lowered[c_name]) >= UNCERTAIN_THRESHOLD:
+                pairs.append((name, c_name))
+    return pairs, comparisons
+
+def _resolve_partition(args):
+    entity_type, names, use_blocking = args
+    return entity_type, resolve_locally(names, use_blocking=use_blocking, desc=f"Resolving {entity_type}")
+
+def resolve_partitioned(name_types, use_blocking=True, workers=PARTITION_WORKERS):
+    """
+    Phase 1 per entity type: each type partition is resolved independently (in worker processes when
+    there are several partitions and enough names), then canonical names of the CROSS_TYPE_GROUPS, and
+    untyped canonical names against every type, are paired across types for the LLM.
+    Returns the same (name_mapping, canonical_names, uncertain_pairs, comparisons) as resolve_locally.
+    """
+    partitions = defaultdict(list)
+    for name, entity_type in name_types.items():
+        partitions[entity_type].append(name)
+
+    name_mapping = {}
+    canonical_by_type = {}
+    uncertain_pairs = []
+    comparisons = 0
+    jobs = [(entity_type, names, use_blocking) for entity_type, names in sorted(partitions.items(), key=lambda kv: -len(kv[1]))]
+    if len(jobs) > 1 and workers > 1 and len(name_types) >= PARALLEL_MIN_NAMES:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = list(executor.map(_resolve_partition, jobs))
+    else:
+        results = map(_resolve_partition, jobs)
+    for entity_type, (mapping, canonical, pairs, cmp) in results:
+        name_mapping.update(mapping)
+        canonical_by_type[entity_type] = canonical
+        uncertain_pairs.extend(pairs)
+        comparisons += cmp
+        print(f"  {entity_type}: {len(mapping):,} names -> {len(canonical):,} canonical, {len(pairs):,} uncertain pairs")
+
+    cross_groups = CROSS_TYPE_GROUPS + [(UNKNOWN_TYPE, t) for t in sorted(canonical_by_type) if t != UNKNOWN_TYPE]
+    for type_1, type_2 in cross_groups:
+        if type_1 in canonical_by_type and type_2 in canonical_by_type:
+            pairs, cmp = cross_type_pairs(canonical_by_type[type_1], canonical_by_type[type_2], use_blocking)
+            uncertain_pairs.extend(pairs)
+            comparisons += cmp
+            print(f"  {type_1}/{type_2} cross-type pass: {len(pairs):,} pairs for the LLM")
+
+    canonical_names = [name for canonical in canonical_by_type.values() for name in canonical]
+    return name_mapping, canonical_names, uncertain_pairs, comparisons
+
+def blocking_report(names):
+    """Runs Phase 1 with and without blocking and prints the speed/recall tradeoff."""
+    start = time.perf_counter()
+    brute_mapping, brute_canonical, brute_pairs, brute_cmp = resolve_locally(names, use_blocking=False)
+    brute_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    block_mapping, block_canonical, block_pairs, block_cmp = resolve_locally(names, use_blocking=True)
+    block_time = time.perf_counter() - start
+
+    same_mapping = sum(1 for n in brute_mapping if brute_mapping[n] == block_mapping.get(n))
+    brute_merges = {n for n, c in brute_mapping.items() if n != c}
+    block_merges = {n for n, c in block_mapping.items() if n != c}
+    brute_pair_set = set(brute_pairs)
+    pair_recall = len(brute_pair_set & set(block_pairs)) / len(brute_pair_set) if brute_pair_set else 1.0
+    merge_recall = len(brute_merges & block_merges) / len(brute_merges) if brute_merges else 1.0
+
+    print("\n--- Phase 1 blocking report ---")
+    print(f"Names: {len(names):,}")
+    print(f"Brute force: {brute_time:.2f}s, {brute_cmp:,} comparisons, {len(brute_canonical):,} canonical, {len(brute_pairs):,} uncertain pairs")
+    print(f"Blocked:     {block_time:.2f}s, {block_cmp:,} comparisons, {len(block_canonical):,} canonical, {len(block_pairs):,} uncertain pairs")
+    print(f"Identical mappings: {same_mapping:,}/{len(brute_mapping):,} ({same_mapping / max(1, len(brute_mapping)):.2%})")
+    print(f"Auto-merge recall:     {merge_recall:.2%}")
+    print(f"Uncertain-pair recall: {pair_recall:.2%}")
+
+def kernel_benchmark(names):
+    """Times Phase 1 with and without the similarity kernel, for both candidate generators, and checks the output matches."""
+    print("\n--- Phase 1 similarity kernel benchmark ---")
+    print(f"Names: {len(names):,}")
+    for use_blocking in (False, True):
+        results = {}
+        for use_kernel in (False, True):
+            start = time.perf_counter()
+            results[use_kernel] = resolve_locally(names, use_blocking=use_blocking, use_kernel=use_kernel)
+            elapsed = time.perf_counter() - start
+            label = ("blocked" if use_blocking else "brute force") + (" + kernel" if use_kernel else "")
+            print(f"{label:<22} {elapsed:7.2f}s, {results[use_kernel][3]:,} Jaro-Winkler calls")
+        plain, kerneled = results[False], results[True]
+        same = plain[0] == kerneled[0] and plain[2] == kerneled[2]
+        print(f"{'':<22} identical mappings and uncertain pairs: {'✅' if same else '❌'}")
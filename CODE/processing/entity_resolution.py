@@ -1,47 +1,74 @@
 import json
 import os
-import jellyfish
-from openai import OpenAI
+import argparse
+import asyncio
+import tempfile
+import textwrap
+from collections import Counter, defaultdict
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from tqdm import tqdm
 
-from config import EXTRACTED_KNOWLEDGE_PATH, FINAL_KG_PATH, VOYAGER_API_KEY, VOYAGER_BASE_URL
+from config import EXTRACTED_KNOWLEDGE_PATH, EXTRACTED_KNOWLEDGE_JSONL_PATH, FINAL_KG_PATH, VOYAGER_API_KEY, VOYAGER_BASE_URL
+from processing.entity_matching import resolve_locally, resolve_partitioned, majority_types, blocking_report, kernel_benchmark, sort_names
+from processing.entity_embeddings import embedding_tier
+from utilities.async_llm import MAX_RETRIES, voyager_limiters, call_llm
+from utilities.jsonl_store import JsonlStore
+from utilities.normalizer import normalize_document, finalize_document, mark_finalized
+from utilities.pair_store import PairDecisionStore, pair_key
+from utilities.tokens import count_tokens
+from utilities.union_find import UnionFind
 
 INPUT_FILE = EXTRACTED_KNOWLEDGE_PATH
+INPUT_LOG = EXTRACTED_KNOWLEDGE_JSONL_PATH
 OUTPUT_FILE = FINAL_KG_PATH
 
+# Phase 2 chunks are sized by the token count of their pairs, capped so the answer stays short
+CHUNK_TOKEN_BUDGET = 2000
+MAX_PAIRS_PER_CHUNK = 60
+
+# Pairs asked per wave; answers from one wave prune the pairs of the next
+WAVE_SIZE = 1200
+
+
 api_key = VOYAGER_API_KEY.strip().strip('"').strip("'")  # Strip spaces/quotes just in case
 
 if not api_key.startswith("sk-"):
     raise ValueError(f"CRITICAL: API Key must start with 'sk-'. Currently it is: '{api_key[:4]}...'")
 
-# Configure OpenAI client for ASU Voyager
-client = OpenAI(
+# Configure OpenAI client for ASU Voyager. Retries are handled by call_llm so they can feed the concurrency limiter
+client = AsyncOpenAI(
     api_key=api_key,
-    base_url=VOYAGER_BASE_URL
+    base_url=VOYAGER_BASE_URL,
+    max_retries=0
 )
 
-def resolve_batches(uncertain_pairs, checkpoint_state, checkpoint_file):
-    resolved_decisions = []
-    
-    # Chunking: 20 per chunk
-    chunk_size = 20
-    chunks = [uncertain_pairs[i:i + chunk_size] for i in range(0, len(uncertain_pairs), chunk_size)]
-    
-    print(f"Total uncertain pairs: {len(uncertain_pairs)}. Processing in {len(chunks)} chunks...")
-    
-    for c_idx, chunk in enumerate(chunks):
-        print(f"Processing chunk {c_idx+1}/{len(chunks)}...")
+def plan_chunks(uncertain_pairs):
+    """Packs pairs into chunks by token count instead of a fixed 20, so short names share a call."""
+    chunks = []
+    current, current_tokens = [], 0
+    for pair in uncertain_pairs:
+        tokens = count_tokens(json.dumps({"pair_id": pair["id"], "entity1": pair["e1"], "entity2": pair["e2"]}, indent=2))
+        if current and (current_tokens + tokens > CHUNK_TOKEN_BUDGET or len(current) >= MAX_PAIRS_PER_CHUNK):
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(pair)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def resolve_chunk(chunk, c_idx, limiter, bucket, decision_store):
+    # Build prompt payload
+    pairs_payload = []
+    for pair in chunk:
+        pairs_payload.append({
+            "pair_id": pair["id"],
+            "entity1": pair["e1"],
+            "entity2": pair["e2"]
+        })
         
-        # Build prompt payload
-        pairs_payload = []
-        for pair in chunk:
-            pairs_payload.append({
-                "pair_id": pair["id"],
-                "entity1": pair["e1"],
-                "entity2": pair["e2"]
-            })
-            
-        prompt = f"""Here is a JSON list of {len(chunk)} entity pairs. Identify which pairs mean the exact same thing in a business/tech context. 
+    prompt = f"""Here is a JSON list of {len(chunk)} entity pairs. Identify which pairs mean the exact same thing in a business/tech context. 
 Return ONLY a JSON object with a single key "results" that contains an array of objects in this format:
 {{
   "results": [
@@ -53,266 +80,412 @@ Return ONLY a JSON object with a single key "results" that contains an array of
 Entity Pairs:
 {json.dumps(pairs_payload, indent=2)}"""
 
-        try:
-            response = client.chat.completions.create(
+    try:
+        response = await call_llm(
+            lambda: client.chat.completions.create(
                 model="qwen3-235b-a22b-instruct-2507",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.0,
                 response_format={"type": "json_object"}
-            )
-            
-            result_str = response.choices[0].message.content
-            payload = json.loads(result_str)
-            
-            results = payload.get("results", [])
-            if isinstance(results, list):
-                for res in results:
-                    pid = res.get("pair_id")
-                    pair = next((p for p in chunk if p["id"] == pid), None)
-                    if pair:
-                        decision_record = {
-                            "is_same": res.get("is_same", False),
-                            "canonical_name": res.get("canonical_name"),
-                            "e1": pair["e1"],
-                            "e2": pair["e2"]
-                        }
-                        resolved_decisions.append(decision_record)
-                        
-                        pair_key = f"{pair['e1']}|||{pair['e2']}"
-                        checkpoint_state[pair_key] = decision_record
-                
-                with open(checkpoint_file, "w") as f:
-                    json.dump(checkpoint_state, f, indent=2)
-                print(f"💾 Checkpoint saved: {len(checkpoint_state)} total entities resolved.")
+            ),
+            limiter, bucket, max_retries=MAX_RETRIES, label=f"chunk {c_idx+1}"
+        )
+        result_str = response.choices[0].message.content
+        payload = json.loads(result_str)
+    except Exception as e:
+        tqdm.write(f"Error querying LLM for chunk {c_idx+1}: {e}")
+        tqdm.write("Gracefully skipping this chunk...")
+        return []
+
+    results = payload.get("results", [])
+    if not isinstance(results, list):
+        tqdm.write(f"Warning: Unexpected JSON format from LLM for chunk {c_idx+1}.")
+        return []
+
+    pairs_by_id = {pair["id"]: pair for pair in chunk}
+    resolved_decisions = []
+    for res in results:
+        pair = pairs_by_id.get(res.get("pair_id"))
+        if pair:
+            decision_record = {
+                "is_same": res.get("is_same", False),
+                "canonical_name": res.get("canonical_name"),
+                "e1": pair["e1"],
+                "e2": pair["e2"]
+            }
+            resolved_decisions.append(decision_record)
+
+    # One small transaction per chunk, so checkpoint cost does not grow with the number of stored decisions
+    decision_store.put_many(resolved_decisions)
+    return resolved_decisions
+
+async def run_chunks(chunks, limiter, bucket, decision_store):
+    """Runs every chunk concurrently; the limiter decides how many are actually in flight."""
+    resolved_decisions = []
+
+    with tqdm(total=len(chunks), desc="Resolving chunks") as pbar:
+        async def handle(chunk, c_idx):
+            resolved_decisions.extend(await resolve_chunk(chunk, c_idx, limiter, bucket, decision_store))
+            pbar.update(1)
+            pbar.set_postfix(concurrency=int(limiter.limit), decisions=len(resolved_decisions))
+
+        await asyncio.gather(*(handle(chunk, c_idx) for c_idx, chunk in enumerate(chunks)))
+
+    return resolved_decisions
+
+class DecisionClusters:
+    """
+    What earlier decisions already imply about a pair.
+    Same-entity decisions merge union-find clusters; different-entity decisions are kept as
+    cannot-link edges between cluster roots, moved onto the new root whenever two clusters merge.
+    """
+
+    def __init__(self):
+        self.clusters = UnionFind()
+        self.apart = defaultdict(set)
+
+    def find(self, name):
+        return self.clusters.find(name)
+
+    def merge(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if not self.clusters.union(root_a, root_b):
+            return
+        root = self.find(root_a)
+        other = root_b if root == root_a else root_a
+        moved = self.apart.pop(other, set())
+        for r in moved:
+            self.apart[r].discard(other)
+            self.apart[r].add(root)
+        self.apart[root] |= moved
+
+    def separate(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return  # contradicts an earlier merge; the merge stands
+        self.apart[root_a].add(root_b)
+        self.apart[root_b].add(root_a)
+
+    def add(self, decision):
+        if decision.get("is_same", False):
+            self.merge(decision["e1"], decision["e2"])
+        else:
+            self.separate(decision["e1"], decision["e2"])
+
+    def implied(self, a, b):
+        """True/False when earlier decisions already answer the pair, None when it still needs the LLM."""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return True
+        if root_b in self.apart.get(root_a, ()):
+            return False
+        return None
+
+def plan_wave(pairs, clusters):
+    """
+    Picks the next pairs to ask. Pairs touching the clusters with the most open pairs go first,
+    since their answers settle the most other pairs. The pairs of one wave form a forest over
+    clusters, so none of them can be implied by the others; the rest wait for the next wave.
+    """
+    degree = Counter()
+    for e1, e2 in pairs:
+        degree[clusters.find(e1)] += 1
+        degree[clusters.find(e2)] += 1
+    ordered = sorted(pairs, key=lambda p: (-(degree[clusters.find(p[0])] + degree[clusters.find(p[1])]), p))
+
+    forest = UnionFind()
+    wave, deferred = [], []
+    for e1, e2 in ordered:
+        root_1, root_2 = clusters.find(e1), clusters.find(e2)
+        if len(wave) < WAVE_SIZE and not forest.connected(root_1, root_2):
+            forest.union(root_1, root_2)
+            wave.append((e1, e2))
+        else:
+            deferred.append((e1, e2))
+    return wave, deferred
+
+async def resolve_in_waves(pairs, clusters, decision_store):
+    limiter, bucket = voyager_limiters()
+    resolved_decisions = []
+    asked = implied_same = implied_different = 0
+
+    remaining = pairs
+    while remaining:
+        open_pairs = []
+        for e1, e2 in remaining:
+            known = clusters.implied(e1, e2)
+            if known is True:
+                implied_same += 1
+            elif known is False:
+                implied_different += 1
             else:
-                print(f"Warning: Unexpected JSON format from LLM for chunk {c_idx+1}.")
+                open_pairs.append((e1, e2))
+        if not open_pairs:
+            break
+
+        wave, remaining = plan_wave(open_pairs, clusters)
+        uncertain_pairs = [{"id": idx + 1, "e1": e1, "e2": e2} for idx, (e1, e2) in enumerate(wave)]
+        chunks = plan_chunks(uncertain_pairs)
+        print(f"Wave: {len(wave)} pairs in {len(chunks)} chunks ({len(remaining)} waiting on its answers)...")
+
+        # Pairs from failed chunks get no decision and are asked again on the next run
+        wave_decisions = await run_chunks(chunks, limiter, bucket, decision_store)
+        for d in wave_decisions:
+            clusters.add(d)
+        resolved_decisions.extend(wave_decisions)
+        asked += len(wave)
+
+    avoided = implied_same + implied_different
+    print(f"Concurrency: peak {limiter.peak_limit:.0f}, final {limiter.limit:.0f}, {limiter.throttles} throttled/failed attempts.")
+    print(f"Transitive pruning: asked {asked:,} pairs, skipped {avoided:,} already implied "
+          f"({implied_same:,} same, {implied_different:,} different), "
+          f"{avoided / max(1, len(pairs)):.1%} of LLM queries avoided.")
+    return resolved_decisions
+
+def resolve_batches(pairs, clusters, decision_store):
+    """Phase 2: asks the LLM about every (e1, e2) pair that the decisions in `clusters` do not already answer."""
+    print(f"Total uncertain pairs: {len(pairs)}.")
+
+    resolved_decisions = asyncio.run(resolve_in_waves(pairs, clusters, decision_store))
+    print(f"💾 Decision store saved: {len(resolved_decisions)} new decisions ({len(decision_store):,} total).")
+    return resolved_decisions
+
+def apply_mapping(doc, name_mapping):
+    if "entities" in doc:
+        for ent in doc["entities"]:
+            old_name = ent.get("name")
+            if old_name in name_mapping:
+                ent["name"] = name_mapping[old_name]
                 
+        unique_ents = {}
+        for ent in doc["entities"]:
+            unique_ents[ent["name"]] = ent
+        doc["entities"] = list(unique_ents.values())
+
+    if "relationships" in doc:
+        new_rels = []
+        for rel in doc["relationships"]:
+            if "source" in rel and rel["source"] in name_mapping:
+                rel["source"] = name_mapping[rel["source"]]
+            if "target" in rel and rel["target"] in name_mapping:
+                rel["target"] = name_mapping[rel["target"]]
+            
+            # Post-Processing Filter: remove self-references
+            if rel.get("source") != rel.get("target"):
+                new_rels.append(rel)
+        doc["relationships"] = new_rels
+    return doc
+
+def finalize(doc):
+    finalize_document(doc)
+    return doc
+
+def open_documents():
+    """
+    Returns (source path, a function that starts a new pass over the documents).
+    The extraction results log is streamed line by line when it exists; otherwise the JSON array
+    is loaded once and shared by both passes.
+    """
+    if os.path.exists(INPUT_LOG):
+        store = JsonlStore(INPUT_LOG)
+        return INPUT_LOG, lambda: iter(store)
+    with open(INPUT_FILE, "r") as f:
+        data = json.load(f)
+    return INPUT_FILE, lambda: iter(data)
+
+def dump_documents(documents, path):
+    """
+    Streams documents into a JSON array, atomically, byte-for-byte like json.dump(list, indent=2).
+    Returns the number of documents written.
+    """
+    count = 0
+    with tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(path)) as tf:
+        for doc in documents:
+            tf.write("[\n" if count == 0 else ",\n")
+            tf.write(textwrap.indent(json.dumps(doc, indent=2), "  "))
+            count += 1
+        tf.write("\n]" if count else "[]")
+        temp_name = tf.name
+    os.replace(temp_name, path)
+    return count
+
+def open_decision_store():
+    """
+    Opens the SQLite decision store. On the first run after the switch, the legacy checkpoint,
+    the current checkpoint JSON and the JSONL decision log are migrated into it once, in that
+    order, so newer decisions win.
+    """
+    from utilities.checkpoint_manager import CheckpointManager
+    checkpoint_mgr = CheckpointManager("entity_resolution", INPUT_FILE)
+    store_path = os.path.join(checkpoint_mgr.checkpoint_dir, "entity_resolution_decisions.sqlite")
+    migrate = not os.path.exists(store_path)
+    decision_store = PairDecisionStore(store_path)
+    if not migrate:
+        return decision_store
+
+    legacy_checkpoint = os.path.join(os.path.dirname(INPUT_FILE), "entity_resolution_checkpoint.json")
+    for path in (legacy_checkpoint, checkpoint_mgr.checkpoint_path):
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r") as f:
+                state = json.load(f)
         except Exception as e:
-            print(f"Error querying LLM for chunk {c_idx+1}: {e}")
-            print("Gracefully skipping this chunk...")
+            print(f"⚠️ Could not load checkpoint {path}: {e}")
             continue
-            
-    return resolved_decisions
+        migrated = [v for k, v in state.items() if k != "source_hash" and isinstance(v, dict) and "e1" in v and "e2" in v]
+        decision_store.put_many(migrated)
+        print(f"ℹ️ Migrated {len(migrated):,} pairs from {os.path.basename(path)}.")
+
+    decision_log = JsonlStore(os.path.join(checkpoint_mgr.checkpoint_dir, "entity_resolution_decisions.jsonl"))
+    logged = list(decision_log)
+    if logged:
+        decision_store.put_many(logged)
+        print(f"ℹ️ Migrated {len(logged):,} decisions from the decision log.")
+    return decision_store
 
-def main():
-    if not os.path.exists(INPUT_FILE):
+def cluster_name(members, suggestions):
+    """
+    Deterministic name for a merged cluster: the canonical name the LLM suggested most often,
+    otherwise the member Phase 1 would have picked (longest, then alphabetical). Ties use the same rule.
+    """
+    if suggestions:
+        return min(suggestions.items(), key=lambda kv: (-kv[1], -len(kv[0]), kv[0]))[0]
+    return sort_names(members)[0]
+
+def apply_decisions(name_mapping, decisions):
+    """
+    Merges the Phase 1 clusters of every positive decision with union-find, then renames each merged
+    cluster once. The clusters and their names do not depend on the order of the decisions.
+    Returns the number of merged clusters.
+    """
+    clusters = UnionFind()
+    suggested = []
+    for d in decisions:
+        if not d.get("is_same", False):
+            continue
+        a = name_mapping.get(d.get("e1"), d.get("e1"))
+        b = name_mapping.get(d.get("e2"), d.get("e2"))
+        clusters.union(a, b)
+        if d.get("canonical_name"):
+            suggested.append((a, d["canonical_name"]))
+
+    votes = defaultdict(Counter)
+    for name, c_name in suggested:
+        votes[clusters.find(name)][c_name] += 1
+
+    renamed = {}
+    merged = 0
+    for root, members in clusters.groups().items():
+        if len(members) < 2:
+            continue
+        merged += 1
+        c_name = cluster_name(members, votes[root])
+        for member in members:
+            renamed[member] = c_name
+
+    for k, v in name_mapping.items():
+        if v in renamed:
+            name_mapping[k] = renamed[v]
+    return merged
+
+def main(use_blocking=True, blocking_report_only=False, kernel_benchmark_only=False, use_embeddings=True, typed=True, embedding_decisions=False):
+    if not os.path.exists(INPUT_FILE) and not os.path.exists(INPUT_LOG):
         print(f"Error: {INPUT_FILE} not found.")
         return
 
     print("Loading extracted knowledge...")
-    with open(INPUT_FILE, "r") as f:
-        data = json.load(f)
-
-    # Pre-Processing: Apply acronyms and title casing
-    ACRONYMS = {
-        "LLM": "Large Language Models",
-        "LLMS": "Large Language Models",
-        "AI": "Artificial Intelligence",
-        "GENAI": "Generative AI",
-        "RAG": "Retrieval-Augmented Generation",
-        "ML": "Machine Learning",
-        "NLP": "Natural Language Processing"
-    }
-
-    import re
-    def clean_name(name):
-        if not name:
-            return name
-        upper_name = str(name).strip().upper()
-        if upper_name in ACRONYMS:
-            name = ACRONYMS[upper_name]
-        
-        name = str(name).title()
-        
-        # Fix specific casing issues caused by .title()
-        name = re.sub(r'\bAi\b', 'AI', name)
-        name = re.sub(r'\bOpenai\b', 'OpenAI', name)
-        name = re.sub(r'\bGenai\b', 'GenAI', name)
-        name = re.sub(r'\bLlm\b', 'LLM', name)
-        name = re.sub(r'\bLlms\b', 'LLMs', name)
-        name = re.sub(r'\bNlp\b', 'NLP', name)
-        name = re.sub(r'\bMl\b', 'ML', name)
-        name = re.sub(r'\bRag\b', 'RAG', name)
-        
-        return name
-
-    for doc in data:
-        if "entities" in doc:
-            normalized_entities = []
-            for ent in doc["entities"]:
-                if isinstance(ent, str):
-                    ent = {"name": ent, "type": "Unknown"}
-                
-                if isinstance(ent, dict) and "name" in ent:
-                    ent["name"] = clean_name(ent["name"])
-                    normalized_entities.append(ent)
-            doc["entities"] = normalized_entities
-
-        if "relationships" in doc:
-            normalized_rels = []
-            for rel in doc["relationships"]:
-                if isinstance(rel, dict):
-                    if "source" in rel:
-                        rel["source"] = clean_name(rel["source"])
-                    if "target" in rel:
-                        rel["target"] = clean_name(rel["target"])
-                    normalized_rels.append(rel)
-            doc["relationships"] = normalized_rels
+    source, documents = open_documents()
+    print(f"Streaming documents from {os.path.basename(source)}.")
 
     # Phase 1: Local Exact/High-Sim Resolution
     # First, collect ALL unique names from the entire dataset (entities + relationships)
-    all_raw_names = set()
-    for doc in data:
-        for ent in doc.get("entities", []):
-            if ent.get("name"):
-                all_raw_names.add(ent["name"])
+    # Pass 1 only keeps name/type counts; documents are normalized on the fly and dropped
+    name_types = majority_types(normalize_document(doc) for doc in documents())
+    all_raw_names = set(name_types)
     
     print(f"Phase 1: Found {len(all_raw_names)} unique entity names to resolve.")
     
-    from tqdm import tqdm
-    name_mapping = {}
-    canonical_names = []
-    uncertain_pairs_raw = []
-
-    # Sort names by length (longer names first often make better canonical names)
-    sorted_names = sorted(list(all_raw_names), key=len, reverse=True)
+    if blocking_report_only:
+        blocking_report(all_raw_names)
+        return
+    if kernel_benchmark_only:
+        kernel_benchmark(all_raw_names)
+        return
 
-    for name in tqdm(sorted_names, desc="Resolving Entities Locally"):
-        if name in name_mapping:
-            continue
-            
-        matched = False
-        # Only compare against existing canonical names
-        for c_name in canonical_names:
-            # Length difference optimization
-            if abs(len(name) - len(c_name)) > 12:
-                continue
-                
-            sim = jellyfish.jaro_winkler_similarity(name.lower(), c_name.lower())
-            
-            if sim > 0.98:
-                name_mapping[name] = c_name
-                matched = True
-                break
-            elif 0.85 <= sim <= 0.98:
-                uncertain_pairs_raw.append((name, c_name))
-        
-        if not matched:
-            name_mapping[name] = name
-            canonical_names.append(name)
+    if typed:
+        # Names are only compared within their entity type, plus the known ambiguous type pairs
+        name_mapping, canonical_names, uncertain_pairs_raw, comparisons = resolve_partitioned(name_types, use_blocking=use_blocking)
+    else:
+        name_mapping, canonical_names, uncertain_pairs_raw, comparisons = resolve_locally(all_raw_names, use_blocking=use_blocking)
+    print(f"Phase 1: {comparisons:,} similarity comparisons ({'blocked' if use_blocking else 'brute force'}).")
 
     print(f"Phase 1: Resolved {len(all_raw_names)} names down to {len(canonical_names)} canonical entities locally.")
     
     # State Initialization & Recovery
-    from utilities.checkpoint_manager import CheckpointManager
-    checkpoint_mgr = CheckpointManager("entity_resolution", INPUT_FILE)
-    
-    checkpoint_file = checkpoint_mgr.checkpoint_path
-    checkpoint_state = {}
-
-    # --- Load legacy checkpoint (old format) and merge it in first ---
-    LEGACY_CHECKPOINT = os.path.join(os.path.dirname(INPUT_FILE), "entity_resolution_checkpoint.json")
-    if os.path.exists(LEGACY_CHECKPOINT):
-        try:
-            with open(LEGACY_CHECKPOINT, "r") as f:
-                legacy = json.load(f)
-            checkpoint_state.update({k: v for k, v in legacy.items() if k != "source_hash"})
-            print(f"ℹ️ Merged {len(checkpoint_state):,} pairs from legacy checkpoint.")
-        except Exception as e:
-            print(f"⚠️ Could not load legacy checkpoint: {e}")
+    decision_store = open_decision_store()
+    print(f"Decision store: {len(decision_store):,} previously resolved pairs.")
 
-    # --- Load current checkpoint and merge (current session takes priority) ---
-    if os.path.exists(checkpoint_file):
+    # Embedding tier: propose pairs string similarity cannot see (and, if enabled, decide clear-cut pairs locally)
+    local_decisions = {}
+    if use_embeddings:
         try:
-            with open(checkpoint_file, "r") as f:
-                current = json.load(f)
-            current_pairs = {k: v for k, v in current.items() if k != "source_hash"}
-            checkpoint_state.update(current_pairs)  # current session wins on overlap
-            if current.get("source_hash") != checkpoint_mgr.source_hash:
-                print("ℹ️ Note: Source file changed, existing resolutions are still reused.")
+            local_decisions, proposed_pairs = embedding_tier(
+                canonical_names, uncertain_pairs_raw, name_types if typed else None, decide_locally=embedding_decisions
+            )
+            uncertain_pairs_raw = uncertain_pairs_raw + proposed_pairs
         except Exception as e:
-            print(f"⚠️ Failed to load current checkpoint: {e}.")
+            print(f"⚠️ Embedding tier skipped: {e}")
 
-    resolved_count = len(checkpoint_state)
-    print(f"Loaded {resolved_count:,} previously resolved pairs total.")
-    
-    # Filter Workload — check both key orderings since historical checkpoints may differ
+    # Filter Workload — only the pairs of this run are read from the store; LLM decisions win over local ones
+    known = decision_store.get_many(uncertain_pairs_raw)
     remaining_pairs_raw = []
     decisions = []
     
     for e1, e2 in uncertain_pairs_raw:
-        pair_key = f"{e1}|||{e2}"
-        rev_key  = f"{e2}|||{e1}"
-        if pair_key in checkpoint_state:
-            decisions.append(checkpoint_state[pair_key])
-        elif rev_key in checkpoint_state:
-            decisions.append(checkpoint_state[rev_key])
+        key = pair_key(e1, e2)
+        decision = known.get(key) or local_decisions.get(key)
+        if decision is not None:
+            decisions.append(decision)
         else:
             remaining_pairs_raw.append((e1, e2))
 
-    uncertain_pairs = []
-    for idx, (e1, e2) in enumerate(remaining_pairs_raw):
-        uncertain_pairs.append({"id": idx+1, "e1": e1, "e2": e2})
-        
-    print(f"{len(uncertain_pairs)} pairs remaining to be processed by LLM.")
+    print(f"{len(remaining_pairs_raw)} pairs remaining to be processed by LLM.")
 
     # Phase 2: Batched LLM Resolution
-    if uncertain_pairs:
-        # We pass the checkpoint_mgr.save_checkpoint logic indirectly or update resolve_batches
-        def save_state(state):
-            state["source_hash"] = checkpoint_mgr.source_hash
-            with open(checkpoint_file, "w") as f:
-                json.dump(state, f, indent=2)
-
-        # Update resolve_batches to use this
-        new_decisions = resolve_batches(uncertain_pairs, checkpoint_state, checkpoint_file)
+    if remaining_pairs_raw:
+        # Seed the clusters with Phase 1 merges and earlier decisions so implied pairs are never asked
+        clusters = DecisionClusters()
+        for name, c_name in name_mapping.items():
+            clusters.merge(name, c_name)
+        for d in decisions:
+            clusters.add(d)
+        new_decisions = resolve_batches(remaining_pairs_raw, clusters, decision_store)
         decisions.extend(new_decisions)
+    decision_store.close()
         
     # Apply decisions
-    for d in decisions:
-        if d.get("is_same", False):
-            e1 = d.get("e1")
-            e2 = d.get("e2")
-            c_name = d.get("canonical_name")
-            
-            target_names = {name_mapping.get(e1, e1), name_mapping.get(e2, e2), e1, e2}
-            
-            for k, v in list(name_mapping.items()):
-                if v in target_names:
-                    name_mapping[k] = c_name
-
-    # Phase 3: Final Application to Data
-    for doc in data:
-        if "entities" in doc:
-            for ent in doc["entities"]:
-                old_name = ent.get("name")
-                if old_name in name_mapping:
-                    ent["name"] = name_mapping[old_name]
-                    
-            unique_ents = {}
-            for ent in doc["entities"]:
-                unique_ents[ent["name"]] = ent
-            doc["entities"] = list(unique_ents.values())
-
-        if "relationships" in doc:
-            new_rels = []
-            for rel in doc["relationships"]:
-                if "source" in rel and rel["source"] in name_mapping:
-                    rel["source"] = name_mapping[rel["source"]]
-                if "target" in rel and rel["target"] in name_mapping:
-                    rel["target"] = name_mapping[rel["target"]]
-                
-                # Post-Processing Filter: remove self-references
-                if rel.get("source") != rel.get("target"):
-                    new_rels.append(rel)
-            doc["relationships"] = new_rels
+    merged = apply_decisions(name_mapping, decisions)
+    print(f"Phase 2: {merged:,} clusters merged from {sum(1 for d in decisions if d.get('is_same'))} positive decisions.")
 
+    # Phase 3: Final Application to Data (second streaming pass; clean_name is memoized by now)
+    # The final clean-up runs in the same pass, so post_process_graph has nothing left to redo
     print(f"Saving normalized knowledge to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    count = dump_documents((finalize(apply_mapping(normalize_document(doc), name_mapping)) for doc in documents()), OUTPUT_FILE)
+    mark_finalized(OUTPUT_FILE, count)
+    print(f"Wrote {count:,} documents.")
 
     print("Normalization complete!")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Resolve duplicate entities in the extracted knowledge")
+    parser.add_argument("--brute-force", action="store_true", help="Compare every name against every canonical name in Phase 1 (no blocking)")
+    parser.add_argument("--blocking-report", action="store_true", help="Compare blocked vs brute-force Phase 1 on the current data and exit")
+    parser.add_argument("--kernel-benchmark", action="store_true", help="Time Phase 1 with and without the vectorized similarity kernel and exit")
+    parser.add_argument("--no-embeddings", action="store_true", help="Skip the embedding tier (string similarity and the LLM only)")
+    parser.add_argument("--embedding-decisions", action="store_true", help="Let the embedding tier merge/reject clear-cut string-similar pairs without the LLM")
+    parser.add_argument("--untyped", action="store_true", help="Resolve all names in one pool instead of per entity type")
+    args = parser.parse_args()
+    main(use_blocking=not args.brute_force, blocking_report_only=args.blocking_report, kernel_benchmark_only=args.kernel_benchmark,
+         use_embeddings=not args.no_embeddings, typed=not args.untyped, embedding_decisions=args.embedding_decisions)
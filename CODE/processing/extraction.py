@@ -1,8 +1,9 @@
 import pandas as pd
 import json
 import os
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import asyncio
+from collections import defaultdict
 from threading import Lock
 from tqdm import tqdm
 
@@ -10,24 +11,35 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from json_repair import loads
 
-from config import MASTER_DATASET_PATH, EXTRACTED_KNOWLEDGE_PATH, REDDIT_CLEANED_CSV_PATH, TECHCRUNCH_CLEANED_CSV_PATH, STARTUPS_GALLERY_CLEANED_CSV_PATH, JOBBOARDS_CLEANED_CSV_PATH, YCOMBINATOR_CLEANED_CSV_PATH
+from config import VOYAGER_MODEL_NAME, EXTRACTION_CACHE_PATH, MASTER_DATASET_PATH, EXTRACTED_KNOWLEDGE_PATH, EXTRACTED_KNOWLEDGE_JSONL_PATH, REDDIT_CLEANED_CSV_PATH, TECHCRUNCH_CLEANED_CSV_PATH, STARTUPS_GALLERY_CLEANED_CSV_PATH, JOBBOARDS_CLEANED_CSV_PATH, YCOMBINATOR_CLEANED_CSV_PATH
 from utilities.llm_client import get_llm
+from utilities.extraction_cache import ExtractionCache, content_hash
+from utilities.jsonl_store import JsonlStore
+from utilities.async_llm import MAX_RETRIES, voyager_limiters, call_llm
+from utilities.tokens import count_tokens
 
-# How often to save to disk? (e.g., save every 5 posts)
+# How often to fsync the results log and update the checkpoint? (e.g., every 5 posts)
 SAVE_BATCH_SIZE = 5
 
-MAX_WORKERS = 5
+# Batched extraction: pack short documents into one call to amortize the ~1.5 KB prompt preamble.
+# Documents above SHORT_DOC_TOKENS (long TechCrunch articles, YC descriptions) always go alone.
+BATCHED_EXTRACTION = True
+SHORT_DOC_TOKENS = 400
+BATCH_TOKEN_BUDGET = 2400
+MAX_DOCS_PER_BATCH = 8
 results_lock = Lock()
 
+# Results are streamed to the append-only JSONL log; the JSON array is compacted from it for downstream steps
+RESULTS_LOG = EXTRACTED_KNOWLEDGE_JSONL_PATH
 OUTPUT_FILE = EXTRACTED_KNOWLEDGE_PATH
 
+# Placeholder URLs that cannot identify a post on their own
+MISSING_URLS = {"", "N/A", "No Post Link"}
+
 # --- THE IMPROVED PROMPT ---
 # We now enforce specific VERBS for relationships.
-extraction_prompt = ChatPromptTemplate.from_template("""
-You are an expert Knowledge Graph engineer for the TrendScout AI project.
-Your goal is to extract structured knowledge from the text below.
-
-### 1. EXTRACT ENTITIES
+# Sections 1-2 are shared by the single-document and batched prompts
+EXTRACTION_RULES = """### 1. EXTRACT ENTITIES
 Identify entities and assign one of these types:
 - **Organization**: Companies, VCs, Startups (e.g., "OpenAI", "Sequoia").
 - **Technology**: Models, Tools, Hardware (e.g., "GPT-4", "H100 GPU", "LangChain").
@@ -55,7 +67,16 @@ Connect entities using ONLY the following specific verbs.
 
 CRITICAL RULE: You must map all discovered relationships to ONE of the exact verbs provided in the allowed schema list. Do NOT invent new relationship verbs. If you find a nuanced relationship that does not perfectly fit, categorize it under 'RELATED_TO' and explain the nuance in the node's 'description' property.
 
-### 3. OUTPUT FORMAT
+"""
+
+FORMATTING_RULE = """CRITICAL FORMATTING RULE: You MUST include all keys in every JSON object. NEVER drop the 'target' key in the relationships array. An example of a FATAL ERROR is {{"source": "A", "relation": "B", "C"}}. The CORRECT format is {{"source": "A", "relation": "B", "target": "C"}}. DO NOT BE LAZY.
+"""
+
+EXTRACTION_TEMPLATE = """
+You are an expert Knowledge Graph engineer for the TrendScout AI project.
+Your goal is to extract structured knowledge from the text below.
+
+""" + EXTRACTION_RULES + """### 3. OUTPUT FORMAT
 Return valid JSON only.
 
 Input Text:
@@ -71,42 +92,155 @@ JSON Output:
   ]
 }}
 
-CRITICAL FORMATTING RULE: You MUST include all keys in every JSON object. NEVER drop the 'target' key in the relationships array. An example of a FATAL ERROR is {{"source": "A", "relation": "B", "C"}}. The CORRECT format is {{"source": "A", "relation": "B", "target": "C"}}. DO NOT BE LAZY.
-""")
+""" + FORMATTING_RULE
+extraction_prompt = ChatPromptTemplate.from_template(EXTRACTION_TEMPLATE)
 
-def load_existing_results():
-    """Reads the JSON file to see what we've already processed."""
-    if os.path.exists(OUTPUT_FILE):
+# Several short documents per call. Each document keeps its own ID so the answer can be split back up.
+BATCH_EXTRACTION_TEMPLATE = """
+You are an expert Knowledge Graph engineer for the TrendScout AI project.
+Your goal is to extract structured knowledge from each of the independent documents below.
+
+""" + EXTRACTION_RULES + """### 3. OUTPUT FORMAT
+Each document is wrapped in [DOC id] ... [END DOC id] markers. Extract entities and relationships from every document separately and never connect entities across documents.
+Return valid JSON only: one object whose "documents" array contains exactly one entry per input document, using the same id.
+
+Input Documents:
+{documents}
+
+JSON Output:
+{{
+  "documents": [
+    {{
+      "id": "d1",
+      "entities": [
+        {{"name": "Entity Name", "type": "Organization|Technology|Trend|Person", "sentiment": "positive|neutral|negative"}}
+      ],
+      "relationships": [
+        {{"source": "Entity Name", "relation": "SPECIFIC_VERB_FROM_LIST", "target": "Entity Name"}}
+      ]
+    }}
+  ]
+}}
+
+""" + FORMATTING_RULE
+batch_extraction_prompt = ChatPromptTemplate.from_template(BATCH_EXTRACTION_TEMPLATE)
+
+# Cache entries are only reused for the exact prompt + model that produced them
+PROMPT_VERSION = hashlib.md5(f"{VOYAGER_MODEL_NAME}\n{EXTRACTION_TEMPLATE}".encode('utf-8')).hexdigest()[:12]
+BATCH_PROMPT_VERSION = hashlib.md5(f"{VOYAGER_MODEL_NAME}\n{BATCH_EXTRACTION_TEMPLATE}".encode('utf-8')).hexdigest()[:12]
+
+def is_valid_result(item):
+    return isinstance(item, dict) and bool(item.get('entities') or item.get('relationships'))
+
+def is_missing_url(url):
+    return not isinstance(url, str) or url.strip() in MISSING_URLS
+
+def key_legacy_results(items, df):
+    """
+    Legacy results carry no content hash, and those without a real URL cannot be matched to their row,
+    so they would be extracted and logged a second time. Results are grouped by author and topic: when
+    exactly one row without a URL has that author and topic, the group's result is keyed by that row's
+    content hash (surplus copies dropped). Any other group is ambiguous, since legacy results are in
+    completion order, so its results are dropped and its rows re-extracted. Returns the results to keep.
+    """
+    candidates = defaultdict(dict)
+    for _, row in df.iterrows():
+        if is_missing_url(row.get('Link to post')):
+            group = (str(row.get('Name', 'Unknown')), str(row.get('source_topic', 'AI')))
+            candidates[group].setdefault(content_hash(get_row_text(row)), get_row_url(row))
+
+    kept = []
+    unkeyed = defaultdict(list)
+    for item in items:
+        meta = item.get('metadata', {})
+        if 'content_hash' in meta or not is_missing_url(meta.get('source_url')):
+            kept.append(item)
+        else:
+            unkeyed[(str(meta.get('author', 'Unknown')), str(meta.get('topic', 'AI')))].append(item)
+
+    keyed = surplus = unmatched = 0
+    for group, group_items in unkeyed.items():
+        rows = candidates.get(group, {})
+        if len(rows) != 1:
+            unmatched += len(group_items)
+            continue
+        (key, url), = rows.items()
+        item = group_items[0]
+        item['metadata'].update(content_hash=key, source_url=url)
+        kept.append(item)
+        keyed += 1
+        surplus += len(group_items) - 1
+    if unkeyed:
+        print(f"🔑 Keyed {keyed} legacy extractions without a post URL by content hash, dropped {surplus} duplicate copies "
+              f"and {unmatched} that could not be matched to a single row (their rows are re-extracted).")
+    return kept
+
+def open_results_log(df):
+    """
+    Opens the append-only results log. On the first run after the switch from the JSON array,
+    the legacy file is migrated into the log once, scrubbing any ghost entries and keying results
+    without a post URL on the way.
+    """
+    migrate = not os.path.exists(RESULTS_LOG) and os.path.exists(OUTPUT_FILE)
+    store = JsonlStore(RESULTS_LOG, fsync_every=SAVE_BATCH_SIZE)
+    if migrate:
         try:
             with open(OUTPUT_FILE, 'r') as f:
-                return json.load(f)
+                legacy = json.load(f)
         except json.JSONDecodeError:
             print("⚠️ Warning: Output file exists but is corrupted. Starting fresh.")
-            return []
-    return []
-
-def process_row(row, index, chain):
-    """Worker function to process a single row with exponential backoff"""
-    extraction = None
-    retries = 3
-    delay = 2
-    
-    for attempt in range(retries):
+            legacy = []
+        valid = [item for item in legacy if is_valid_result(item)]
+        if len(valid) < len(legacy):
+            print(f"🧹 Scrubbed {len(legacy) - len(valid)} invalid ghost entries from last run.")
+        valid = key_legacy_results(valid, df)
+        for item in valid:
+            store.append(item)
+        store.close()
+        open(RESULTS_LOG, 'a').close()
+        print(f"Migrated {len(valid)} extractions from {OUTPUT_FILE} to {RESULTS_LOG}.")
+    return store
+
+def compact_results(store):
+    """Rebuilds the JSON array consumed by entity_resolution.py from the results log."""
+    count = store.compact_to(OUTPUT_FILE)
+    print(f"📦 Compacted {count} extractions into {OUTPUT_FILE}")
+
+def get_row_text(row):
+    """The text sent to the LLM. JobBoards rows have no clean_content, so fall back to Post content."""
+    text = row.get('clean_content')
+    if not isinstance(text, str) or not text.strip():
+        text = row.get('Post content')
+    return text if isinstance(text, str) else ""
+
+def get_row_url(row):
+    url = row.get('Link to post')
+    if not isinstance(url, str) or not url.strip():
+        return 'N/A'
+    return url
+
+async def process_row(row, index, chain, cache, limiter, bucket):
+    """Extracts a single row, served from the extraction cache when possible"""
+    text = get_row_text(row)
+    key = content_hash(text)
+    extraction = cache.get(key)
+
+    if extraction is None:
         try:
-            raw_response = chain.invoke({"text": row['clean_content']})
+            raw_response = await call_llm(
+                lambda: chain.ainvoke({"text": text}),
+                limiter, bucket, max_retries=MAX_RETRIES, label=f"post {index}"
+            )
             extraction = loads(raw_response.content)
-            break
         except Exception as e:
-            err_str = str(e).lower()
-            if "429" in err_str or "50" in err_str:
-                if attempt < retries - 1:
-                    time.sleep(delay)
-                    delay *= 2
-                    continue
             tqdm.write(f"⚠️ Fatal Error on post {index}: {e}")
             return None
-            
-    if extraction:
+
+        # Cache every parsed answer, empty ones included, so identical text never costs another call
+        if isinstance(extraction, dict):
+            cache.put(key, extraction)
+
+    if isinstance(extraction, dict):
         has_entities = bool(extraction.get('entities'))
         has_relations = bool(extraction.get('relationships'))
         
@@ -115,13 +249,107 @@ def process_row(row, index, chain):
             
         # Metadata
         extraction['metadata'] = {
-            "source_url": row.get('Link to post', 'N/A'),
+            "source_url": get_row_url(row),
             "author": row.get('Name', 'Unknown'),
-            "topic": row.get('source_topic', 'AI')
+            "topic": row.get('source_topic', 'AI'),
+            "content_hash": key
         }
         return (index, extraction)
     return None
 
+def plan_batches(pending, cache):
+    """
+    Splits unique texts into ones that go through single-document calls (cache hits and long
+    documents) and packed batches of short documents whose combined token count fits the budget.
+    """
+    singles = []
+    batches = []
+    current, current_tokens = [], 0
+    for key, rows in pending.items():
+        text = get_row_text(rows[0][1])
+        tokens = count_tokens(text)
+        if not BATCHED_EXTRACTION or tokens > SHORT_DOC_TOKENS or cache.get(key) is not None:
+            singles.append(rows)
+            continue
+        if current and (current_tokens + tokens > BATCH_TOKEN_BUDGET or len(current) >= MAX_DOCS_PER_BATCH):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((key, text, rows))
+        current_tokens += tokens
+    if len(current) > 1:
+        batches.append(current)
+    elif current:
+        singles.append(current[0][2])
+    return singles, batches
+
+async def extract_batch(batch, batch_chain, cache, limiter, bucket):
+    """
+    Extracts several short documents in one call and caches each document's answer under the
+    batched prompt version. Returns how many documents were answered; missing ones fall back later.
+    """
+    ids = {f"d{i + 1}": key for i, (key, _, _) in enumerate(batch)}
+    documents = "\n\n".join(f"[DOC {doc_id}]\n{text}\n[END DOC {doc_id}]" for doc_id, (_, text, _) in zip(ids, batch))
+
+    raw_response = await call_llm(
+        lambda: batch_chain.ainvoke({"documents": documents}),
+        limiter, bucket, max_retries=MAX_RETRIES, label=f"batch of {len(batch)}"
+    )
+    payload = loads(raw_response.content)
+    entries = payload.get("documents") if isinstance(payload, dict) else payload
+    if not isinstance(entries, list):
+        return 0
+
+    answered = 0
+    for entry in entries:
+        if not isinstance(entry, dict) or str(entry.get("id")) not in ids:
+            continue
+        extraction = {
+            "entities": entry.get("entities") or [],
+            "relationships": entry.get("relationships") or []
+        }
+        cache.put(ids[str(entry["id"])], extraction, version=BATCH_PROMPT_VERSION)
+        answered += 1
+    return answered
+
+async def run_extraction(pending, chain, batch_chain, cache, record, total):
+    """Runs every unique text concurrently; the limiter decides how many are actually in flight."""
+    limiter, bucket = voyager_limiters()
+    singles, batches = plan_batches(pending, cache)
+    batched_docs = sum(len(batch) for batch in batches)
+    answered_docs = 0
+    print(f"Packed {batched_docs} short documents into {len(batches)} batched calls; {len(singles)} texts go alone.")
+
+    with tqdm(total=total, desc="Extracting") as pbar:
+        async def handle(rows):
+            try:
+                for index, row in rows:
+                    # Duplicates after the first, and batched documents, are served from the cache
+                    record(await process_row(row, index, chain, cache, limiter, bucket))
+            except Exception as e:
+                tqdm.write(f"⚠️ Unexpected error processing post {rows[0][0]}: {e}")
+            pbar.update(len(rows))
+            pbar.set_postfix(concurrency=int(limiter.limit))
+
+        async def handle_batch(batch):
+            nonlocal answered_docs
+            try:
+                answered = await extract_batch(batch, batch_chain, cache, limiter, bucket)
+                answered_docs += answered
+            except Exception as e:
+                tqdm.write(f"⚠️ Batched call failed ({e}). Falling back to single-document calls.")
+            # Anything the batch did not answer is not in the cache, so process_row calls the LLM for it alone
+            for _, _, rows in batch:
+                await handle(rows)
+
+        await asyncio.gather(
+            *(handle(rows) for rows in singles),
+            *(handle_batch(batch) for batch in batches)
+        )
+
+    if batches:
+        print(f"Batched calls answered {answered_docs}/{batched_docs} documents; the rest fell back to single calls.")
+    print(f"Concurrency: peak {limiter.peak_limit:.0f}, final {limiter.limit:.0f}, {limiter.throttles} throttled/failed attempts.")
+
 def extract_knowledge():
     dfs = []
     if os.path.exists(MASTER_DATASET_PATH):
@@ -166,87 +394,83 @@ def extract_knowledge():
     # or we can hash the combined dataframe length. For simplicity, we track 'extraction_progress'.
     checkpoint_mgr = CheckpointManager("extraction_progress", MASTER_DATASET_PATH)
     
-    existing_results = load_existing_results()
-    
-    # Task 1 & 2: Scrub out any incomplete ghost entries created by early termination/Ctrl+C
-    valid_json_data = []
-    for item in existing_results:
-        if isinstance(item, dict):
-            has_entities = bool(item.get('entities'))
-            has_relations = bool(item.get('relationships'))
-            if has_entities or has_relations:
-                valid_json_data.append(item)
-                
-    if len(valid_json_data) < len(existing_results):
-        print(f"🧹 Scrubbed {len(existing_results) - len(valid_json_data)} invalid ghost entries from last run.")
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(valid_json_data, f, indent=2)
-            
-    existing_results = valid_json_data
-    print(f"Loaded {len(valid_json_data)} fully completed extractions from previous runs.")
-    
-    # Create a Checksum/Tracking Set using the Link to post URL
+    store = open_results_log(df)
+
+    # Track finished rows by (content hash, URL). Older entries without a content hash fall back to
+    # their URL, as long as it is a real one. Only the metadata is kept in memory.
+    processed_keys = set()
     processed_urls = set()
-    for item in existing_results:
-        if 'metadata' in item and 'source_url' in item['metadata']:
-            processed_urls.add(item['metadata']['source_url'])
-    
-    # Filter the incoming Pandas DataFrame to drop any rows whose unique identifier is already in the tracking set.
-    df_to_process = df[~df['Link to post'].isin(processed_urls)]
-    
-    skipped_count = len(df) - len(df_to_process)
-    new_rows_count = len(df_to_process)
+    total_results = 0
+    for item in store:
+        total_results += 1
+        meta = item.get('metadata', {})
+        if 'content_hash' in meta:
+            processed_keys.add((meta['content_hash'], meta.get('source_url')))
+        elif not is_missing_url(meta.get('source_url')):
+            processed_urls.add(meta.get('source_url'))
+    print(f"Loaded {total_results} fully completed extractions from previous runs.")
+
+    # Group the remaining rows by content hash so duplicates wait for one extraction instead of racing to the LLM
+    pending = defaultdict(list)
+    skipped_count = 0
+    for index, row in df.iterrows():
+        key = content_hash(get_row_text(row))
+        url = get_row_url(row)
+        if (key, url) in processed_keys or url in processed_urls:
+            skipped_count += 1
+            continue
+        pending[key].append((index, row))
+
+    new_rows_count = sum(len(rows) for rows in pending.values())
 
     if new_rows_count == 0:
         print(f"Skipping {skipped_count} already processed rows. Extracting 0 new rows...")
+        if not os.path.exists(OUTPUT_FILE) or os.path.getmtime(OUTPUT_FILE) < os.path.getmtime(RESULTS_LOG):
+            compact_results(store)
         print("🎉 All posts have been processed!")
         return
 
     try:
-        llm = get_llm()
+        # Retries are handled by call_llm so they can feed the concurrency limiter
+        llm = get_llm(max_retries=0)
     except Exception as e:
         print(e)
         return
 
     # We remove the strict parser to allow json_repair to handle it natively over the raw string
     chain = extraction_prompt | llm
+    batch_chain = batch_extraction_prompt | llm
+
+    cache = ExtractionCache(EXTRACTION_CACHE_PATH, PROMPT_VERSION, fallback_versions=[BATCH_PROMPT_VERSION])
+    print(f"Extraction cache: {len(cache)} entries for prompt version {PROMPT_VERSION}.")
 
-    results = existing_results
     processed_in_this_run = 0
     
-    print(f"Skipping {skipped_count} already processed rows. Extracting {new_rows_count} new rows...")
-    
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Build the futures
-        future_to_row = {executor.submit(process_row, row, index, chain): index for index, row in df_to_process.iterrows()}
-        
-        # Iterate as they complete using tqdm for a clean progress bar
-        for future in tqdm(as_completed(future_to_row), total=len(future_to_row), desc="Extracting"):
-            index = future_to_row[future]
-            try:
-                res = future.result()
-                if res is not None:
-                    _, extraction = res
-                    
-                    with results_lock:
-                        results.append(extraction)
-                        processed_in_this_run += 1
-                        
-                        # --- CHECKPOINT: BATCH SAVE ---
-                        if processed_in_this_run % SAVE_BATCH_SIZE == 0:
-                            tqdm.write(f"💾 Checkpointing... Saved {len(results)} total posts to disk.")
-                            with open(OUTPUT_FILE, 'w') as f:
-                                json.dump(results, f, indent=2)
-                            checkpoint_mgr.save_checkpoint(len(results))
-            except Exception as e:
-                tqdm.write(f"⚠️ Unexpected error processing post {index}: {e}")
+    print(f"Skipping {skipped_count} already processed rows. Extracting {new_rows_count} new rows ({len(pending)} unique texts)...")
+
+    def record(res):
+        nonlocal processed_in_this_run
+        if res is None:
+            return
+        _, extraction = res
+        with results_lock:
+            # One line per result; the store fsyncs every SAVE_BATCH_SIZE appends
+            store.append(extraction)
+            processed_in_this_run += 1
+
+            # --- CHECKPOINT: BATCH SAVE ---
+            if processed_in_this_run % SAVE_BATCH_SIZE == 0:
+                checkpoint_mgr.save_checkpoint(total_results + processed_in_this_run)
+
+    asyncio.run(run_extraction(pending, chain, batch_chain, cache, record, new_rows_count))
+
+    cache.close()
 
     # --- FINAL SAVE ---
-    # Catch any remaining posts that didn't trigger the batch save
-    if processed_in_this_run > 0 and processed_in_this_run % SAVE_BATCH_SIZE != 0:
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(results, f, indent=2)
-        checkpoint_mgr.save_checkpoint(len(results))
+    # Sync the tail of the log, then build the JSON array downstream steps read
+    store.close()
+    checkpoint_mgr.save_checkpoint(total_results + processed_in_this_run)
+    compact_results(store)
     
     print(f"\n✅ Success! Semantic Extraction fully saved to: {OUTPUT_FILE}")
 
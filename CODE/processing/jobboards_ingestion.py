@@ -1,11 +1,13 @@
 import os
 import sys
-import hashlib
 import pandas as pd
 
 # Add root directory to path so config can be imported
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import CHROMA_DB_PATH
+from CODE.utilities.vector_sync import sync_collection
+from CODE.utilities.chunker import chunk_records
+from CODE.utilities.embeddings import LocalEmbedder
 
 # ── Paths ────────────────────────────────────────────────────────────────────
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -21,13 +23,6 @@ OUTPUT_PATH = os.path.join(
 )
 
 
-def generate_id(url: str, index: int) -> str:
-    """Stable deterministic ID matching the pattern used by vector_store_setup.py."""
-    if url:
-        return hashlib.md5(str(url).encode("utf-8")).hexdigest() + f"_{index}"
-    return f"jobboard_post_{index}"
-
-
 def build_document_content(row: pd.Series) -> str:
     """Combine title and description into the main searchable text."""
     title = str(row.get("title", "")).strip()
@@ -104,52 +99,27 @@ def main():
         chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
         collection = chroma_client.get_or_create_collection(name="market_intelligence")
 
-        docs, metadatas, ids = [], [], []
-
-        for idx, row in out_df.iterrows():
-            docs.append(str(row["Post content"]))
-
-            meta = {
-                "author_name": str(row.get("Name", "")),
-                "authors":     str(row.get("Name", "")),
-                "profile_url": str(row.get("Link to profile", "")),
-                "post_url":    str(row.get("Link to post", "")),
-                "source_topic": str(row.get("source_topic", "")),
-                "source":      "JobBoards",
-                "keywords":    str(row.get("keywords", "")),
-                # Job-specific extras (always strings so ChromaDB accepts them)
-                "job_title":     str(row.get("job_title", "")),
-                "location":      str(row.get("location", "")),
-                "role_category": str(row.get("role_category", "")),
-                "company":       str(row.get("company", "")),
-                "employment_type": str(row.get("employment_type", "")),
-                "salary_normalized": str(row.get("salary_normalized", "")),
-                "salary_min": str(row.get("salary_min", "")),
-                "salary_max": str(row.get("salary_max", "")),
-                "salary_currency": str(row.get("salary_currency", "")),
-            }
-            metadatas.append(meta)
-            ids.append(generate_id(row.get("Link to post", ""), idx))
-
-        batch_size = 1000
-        for i in range(0, len(docs), batch_size):
-            end = min(i + batch_size, len(docs))
-            collection.upsert(
-                documents=docs[i:end],
-                metadatas=metadatas[i:end],
-                ids=ids[i:end],
-            )
-            print(f"[JobBoards Ingestion] Upserted items {i} – {end - 1}")
+        # Metadata is built from the saved CSV exactly as vector_store_setup.py builds it (empty fields are
+        # dropped), so both upload paths write identical records and re-syncing changes nothing
+        from CODE.database.vector_store_setup import load_csv, prepare_documents
+        docs, metadatas = prepare_documents(load_csv(OUTPUT_PATH))
+
+        # Same chunks and content-addressed IDs vector_store_setup.py gives these rows
+        docs, metadatas, ids = chunk_records(docs, metadatas)
 
+        # Only new postings are embedded; postings no longer in the CSV are removed
+        embedder = LocalEmbedder()
+        counts = sync_collection(collection, docs, metadatas, ids, where={"source": "JobBoards"}, embed=embedder)
         print(
-            f"[JobBoards Ingestion] Done. {len(docs)} job postings ingested "
-            f"into ChromaDB collection 'market_intelligence' with source='JobBoards'."
+            f"[JobBoards Ingestion] Done. {len(docs)} job postings synced "
+            f"into ChromaDB collection 'market_intelligence' with source='JobBoards' "
+            f"({counts['embedded']} embedded, {counts['updated']} updated, {counts['deleted']} removed)."
         )
 
         # ── Quick smoke-test ──────────────────────────────────────────────────
         print("\n[JobBoards Ingestion] --- Smoke test: 'machine learning engineer' ---")
         test = collection.query(
-            query_texts=["machine learning engineer"],
+            query_embeddings=embedder(["machine learning engineer"]),
             n_results=3,
             where={"source": "JobBoards"},
         )
@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+# A cached answer is reused for questions whose normalized embeddings are at least this similar
+SIMILARITY_THRESHOLD = 0.95
+TTL_SECONDS = 60 * 60
+MAX_ENTRIES = 512
+
+class SemanticAnswerCache:
+    """
+    In-memory answer cache keyed by normalized query embeddings, shared by every chat session of the app.
+    A lookup returns the most similar live entry above the threshold. Entries expire after `ttl`
+    seconds, the least recently used ones are evicted beyond `max_entries`, and everything is dropped
+    when the collection's content version changes, since the stored answers cite its old content.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = Lock()
+
+    def _sync_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def _drop_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, query_embedding, version):
+        """Returns the cached entry (answer, context, similarity, ...) for a similar question, or None."""
+        with self._lock:
+            self._sync_version(version)
+            self._drop_expired(time.time())
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            keys = list(self._entries)
+            vectors = np.stack([self._entries[key]["embedding"] for key in keys])
+            similarities = vectors @ np.asarray(query_embedding, dtype=np.float32)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(keys[best])
+            entry = self._entries[keys[best]]
+            return {**entry, "similarity": float(similarities[best])}
+
+    def store(self, query_embedding, version, question, answer, context):
+        with self._lock:
+            self._sync_version(version)
+            self._entries[self._next_key] = {
+                "embedding": np.asarray(query_embedding, dtype=np.float32),
+                "question": question,
+                "answer": answer,
+                "context": context,
+                "created_at": time.time()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,147 @@
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from tqdm import tqdm
+
+# HTTP statuses worth retrying: rate limiting and transient server-side failures
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Voyager limits shared by every stage that calls it: start where the old thread pool was and let AIMD find the ceiling
+INITIAL_CONCURRENCY = 5
+MAX_CONCURRENCY = 64
+# Hard ceiling on request starts per second, independent of concurrency
+REQUESTS_PER_SECOND = 10
+MAX_RETRIES = 5
+
+class TokenBucket:
+    """Async token bucket: allows `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limiter.
+    The limit grows by one every `limit` healthy responses (additive increase) and is halved on a
+    429/5xx/timeout or when the smoothed latency drifts well above the best smoothed latency seen
+    so far (multiplicative decrease). Smoothing keeps one long completion from counting as overload.
+    Decreases are spaced by `cooldown` seconds so one burst of failures only counts once.
+    """
+
+    def __init__(self, initial=5, min_limit=1, max_limit=64, latency_tolerance=2.5, cooldown=5.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.ewma_latency = None
+        self.best_latency = None
+        self.throttles = 0
+        self.peak_limit = self.limit
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, latency):
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = 0.8 * self.ewma_latency + 0.2 * latency
+        if self.best_latency is None or self.ewma_latency < self.best_latency:
+            self.best_latency = self.ewma_latency
+        if self.ewma_latency > self.best_latency * self.latency_tolerance:
+            self._decrease()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+
+    def on_throttle(self):
+        self.throttles += 1
+        self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+
+def voyager_limiters():
+    """A fresh (limiter, bucket) pair with the shared Voyager limits, for one run of a pipeline stage."""
+    return AdaptiveConcurrencyLimiter(initial=INITIAL_CONCURRENCY, max_limit=MAX_CONCURRENCY), TokenBucket(REQUESTS_PER_SECOND)
+
+def status_code_of(error):
+    """HTTP status of an OpenAI SDK error, or None for connection/timeout errors and anything else."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def is_retryable(error):
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # No status means the request never got an HTTP answer (timeout, dropped connection)
+    return type(error).__name__ in {"APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectionError"}
+
+def retry_after(error):
+    """Seconds requested by a Retry-After header, if the server sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+async def call_llm(make_request, limiter, bucket, max_retries=MAX_RETRIES, base_delay=1.0, label="request"):
+    """
+    Awaits make_request() under the concurrency limiter and rate limiter.
+    Retries 429/5xx/timeouts with exponential backoff and jitter (or the server's Retry-After),
+    and feeds every outcome back into the limiter. Non-retryable errors are raised immediately.
+    """
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        async with limiter.slot():
+            start = time.monotonic()
+            try:
+                response = await make_request()
+                limiter.on_success(time.monotonic() - start)
+                return response
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                limiter.on_throttle()
+                error = e
+        if attempt == max_retries:
+            break
+        delay = retry_after(error) or base_delay * 2 ** attempt + random.random()
+        tqdm.write(f"⚠️ {label}: {type(error).__name__} ({status_code_of(error) or 'no status'}), retrying in {delay:.1f}s...")
+        await asyncio.sleep(delay)
+    raise error
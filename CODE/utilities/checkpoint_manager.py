@@ -43,10 +43,36 @@ class CheckpointManager:
             "source_hash": self.source_hash,
             "last_index": last_index
         }
-        
+        self._write_atomic(state)
+
+    def load_state(self, match_source=False):
+        """
+        Loads the state dict saved by save_state. Returns {} if missing, or if `match_source` is set
+        and the source file changed since the state was saved.
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                payload = json.load(f)
+            if match_source and payload.get("source_hash") != self.source_hash:
+                return {}
+            return payload.get("state", {})
+        except Exception:
+            return {}
+
+    def save_state(self, state):
+        """Saves an arbitrary JSON-serializable state dict atomically."""
+        self._write_atomic({
+            "source_hash": self.source_hash,
+            "state": state
+        })
+
+    def _write_atomic(self, payload):
         # Write to temporary file first then rename (atomic)
         with tempfile.NamedTemporaryFile('w', delete=False, dir=self.checkpoint_dir) as tf:
-            json.dump(state, tf)
+            json.dump(payload, tf)
             temp_name = tf.name
         
         shutil.move(temp_name, self.checkpoint_path)
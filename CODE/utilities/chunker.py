@@ -0,0 +1,75 @@
+from functools import lru_cache
+
+from config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from .tokens import count_tokens
+from .vector_sync import document_id
+
+@lru_cache(maxsize=65536)
+def word_tokens(word):
+    # Counted with the leading space the word has inside running text
+    return count_tokens(" " + word)
+
+def split_into_chunks(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Splits text into word-aligned chunks of at most max_tokens tokens (a single longer word is kept whole).
+    Consecutive chunks share up to overlap_tokens tokens of words. Text that fits is returned unchanged.
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    words = text.split()
+    costs = [word_tokens(w) for w in words]
+    chunks = []
+    start = 0
+    while start < len(words):
+        end, total = start, 0
+        while end < len(words) and (end == start or total + costs[end] <= max_tokens):
+            total += costs[end]
+            end += 1
+        chunks.append(" ".join(words[start:end]))
+        if end == len(words):
+            break
+
+        # Step back over the tail of this chunk so the next one starts with some shared context
+        next_start, overlap = end, 0
+        while next_start > start + 1 and overlap + costs[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += costs[next_start]
+        start = next_start
+    return chunks
+
+def chunk_records(docs, metadatas, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Splits every document into chunks for indexing. Returns (chunk docs, chunk metadatas, chunk ids).
+    Each chunk keeps its document's metadata plus parent_id (the document's content-addressed ID),
+    chunk_index and chunk_count, so results can be collapsed back to documents. A document that fits
+    in one chunk keeps the parent ID as its own.
+    """
+    chunk_docs, chunk_metadatas, chunk_ids = [], [], []
+    for doc, meta in zip(docs, metadatas):
+        parent_id = document_id(meta.get("source", ""), meta.get("post_url", ""), doc)
+        chunks = split_into_chunks(doc, max_tokens, overlap_tokens)
+        for i, chunk in enumerate(chunks):
+            chunk_docs.append(chunk)
+            chunk_metadatas.append({**meta, "parent_id": parent_id, "chunk_index": i, "chunk_count": len(chunks)})
+            chunk_ids.append(parent_id if len(chunks) == 1 else f"{parent_id}_{i}")
+    return chunk_docs, chunk_metadatas, chunk_ids
+
+def collapse_chunks(documents, metadatas, limit=None):
+    """
+    Keeps the best-ranked chunk of each document from results ordered best first, up to `limit` documents.
+    Results indexed before chunking (no parent_id) are kept as they are.
+    """
+    seen = set()
+    kept_docs, kept_metas = [], []
+    for doc, meta in zip(documents, metadatas):
+        parent_id = (meta or {}).get("parent_id")
+        if parent_id is not None:
+            if parent_id in seen:
+                continue
+            seen.add(parent_id)
+        kept_docs.append(doc)
+        kept_metas.append(meta)
+        if limit is not None and len(kept_docs) == limit:
+            break
+    return kept_docs, kept_metas
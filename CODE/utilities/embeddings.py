@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import hashlib
+from functools import lru_cache
+from threading import Lock
+
+import numpy as np
+
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_CACHE_PATH
+
+# Texts encoded per model call, and keys looked up per SQLite statement
+ENCODE_BATCH = 256
+LOOKUP_BATCH = 500
+
+@lru_cache(maxsize=None)
+def get_model(model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    """Loads a sentence-transformers model once per process, or returns None if it cannot be loaded."""
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, backend=backend)
+    except Exception as e:
+        print(f"⚠️ Embedding model {model_name} ({backend}) unavailable ({e}).")
+        return None
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent text -> vector cache keyed by (model name, SHA-256 of the text).
+    Vectors are stored L2-normalized as float32 blobs in a local SQLite file, so a dot product is
+    the cosine similarity and each distinct text is encoded once across runs.
+    The backend is not part of the key: torch and ONNX runs of one model give interchangeable vectors.
+    """
+
+    def __init__(self, cache_path, model_name=EMBEDDING_MODEL_NAME):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.cache_path = cache_path
+        self.model_name = model_name
+        self._lock = Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.commit()
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[i:i + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({', '.join('?' for _ in batch)})",
+                    (self.model_name, *batch)
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        return found
+
+    def encode(self, texts, show_progress=False):
+        """
+        Returns an (n, dim) float32 array of normalized vectors, encoding only the texts not cached yet.
+        Raises RuntimeError if some texts are missing and the model cannot be loaded.
+        """
+        keys = [text_hash(t) for t in texts]
+        found = self._lookup(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            model = get_model(self.model_name)
+            if model is None:
+                raise RuntimeError(f"{len(missing)} texts are not cached and {self.model_name} could not be loaded.")
+            missing_keys = list(missing)
+            vectors = model.encode(
+                [missing[k] for k in missing_keys], batch_size=ENCODE_BATCH,
+                normalize_embeddings=True, show_progress_bar=show_progress
+            ).astype(np.float32)
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    [(self.model_name, k, v.tobytes()) for k, v in zip(missing_keys, vectors)]
+                )
+                self._conn.commit()
+            found.update(zip(missing_keys, vectors))
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[k] for k in keys])
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class LocalEmbedder:
+    """
+    The configured local embedding backend as a plain callable for ChromaDB: texts in, vectors out.
+    Every call goes through the on-disk cache, so unchanged text is never embedded twice, whether it is
+    re-indexed, rebuilt into a new collection or queried again by an evaluation run.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, cache_path=EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.cache_path = cache_path
+
+    def __call__(self, texts, show_progress=False):
+        cache = EmbeddingCache(self.cache_path, self.model_name)
+        try:
+            return cache.encode(list(texts), show_progress=show_progress).tolist()
+        finally:
+            cache.close()
@@ -0,0 +1,85 @@
+import os
+import json
+import sqlite3
+import hashlib
+from threading import Lock
+
+def normalize_text(text):
+    """Collapses whitespace so formatting-only differences map to the same cache entry."""
+    if not isinstance(text, str):
+        return ""
+    return " ".join(text.split())
+
+def content_hash(text):
+    """SHA-256 of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+class ExtractionCache:
+    """
+    Persistent cache of LLM extractions keyed by (content hash, prompt version).
+    Backed by a local SQLite file so it survives runs and is safe to share between worker threads.
+    Entries written under an older prompt version are simply never hit again; prune_stale() drops them.
+    `fallback_versions` are other live prompts (e.g. the batched prompt) whose answers are also accepted.
+    """
+
+    def __init__(self, cache_path, prompt_version, fallback_versions=()):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.cache_path = cache_path
+        self.prompt_version = prompt_version
+        self.versions = [prompt_version, *fallback_versions]
+        self._lock = Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                content_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                extraction TEXT NOT NULL,
+                PRIMARY KEY (content_hash, prompt_version)
+            )
+        """)
+        self._conn.commit()
+
+    def _placeholders(self):
+        return ", ".join("?" for _ in self.versions)
+
+    def get(self, key):
+        """Returns the cached extraction dict for a content hash, or None on a miss. The primary version wins."""
+        with self._lock:
+            rows = dict(self._conn.execute(
+                f"SELECT prompt_version, extraction FROM extractions WHERE content_hash = ? AND prompt_version IN ({self._placeholders()})",
+                (key, *self.versions)
+            ).fetchall())
+        for version in self.versions:
+            if version in rows:
+                return json.loads(rows[version])
+        return None
+
+    def put(self, key, extraction, version=None):
+        """Stores an extraction (including empty ones, so they are not retried every run)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (content_hash, prompt_version, extraction) VALUES (?, ?, ?)",
+                (key, version or self.prompt_version, json.dumps(extraction))
+            )
+            self._conn.commit()
+
+    def prune_stale(self):
+        """Deletes entries written under any prompt version that is no longer live. Returns how many were removed."""
+        with self._lock:
+            cur = self._conn.execute(
+                f"DELETE FROM extractions WHERE prompt_version NOT IN ({self._placeholders()})", tuple(self.versions)
+            )
+            self._conn.commit()
+        return cur.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(DISTINCT content_hash) FROM extractions WHERE prompt_version IN ({self._placeholders()})",
+                tuple(self.versions)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,94 @@
+import os
+import json
+import tempfile
+from threading import Lock
+
+class JsonlStore:
+    """
+    Append-only JSON Lines file.
+    Each record is written as one line and flushed immediately; fsync is batched every
+    `fsync_every` records so a crash loses at most the last unsynced batch, never the whole file.
+    """
+
+    def __init__(self, path, fsync_every=5):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.fsync_every = fsync_every
+        self._lock = Lock()
+        self._unsynced = 0
+        self._file = None
+        self.repair_tail()
+
+    def repair_tail(self):
+        """Drops a partially written last line left behind by an interrupted run."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            # Walk back to the start of the last line
+            pos = size - 1
+            f.seek(pos)
+            if f.read(1) == b"\n":
+                return
+            while pos > 0:
+                pos -= 1
+                f.seek(pos)
+                if f.read(1) == b"\n":
+                    pos += 1
+                    break
+            f.seek(pos)
+            last_line = f.read()
+            try:
+                json.loads(last_line)
+                f.write(b"\n")
+            except ValueError:
+                print(f"🧹 Dropped a truncated record at the end of {os.path.basename(self.path)}.")
+                f.truncate(pos)
+
+    def __iter__(self):
+        """Streams records from disk without loading the whole file."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def append(self, record):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._unsynced = 0
+
+    def compact_to(self, json_path):
+        """Writes all records as a single JSON array, atomically, for consumers that json.load the whole file."""
+        self.close()
+        count = 0
+        with tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(json_path), encoding='utf-8') as tf:
+            tf.write("[\n")
+            for record in self:
+                if count:
+                    tf.write(",\n")
+                tf.write(json.dumps(record, ensure_ascii=False))
+                count += 1
+            tf.write("\n]\n")
+            temp_name = tf.name
+        os.replace(temp_name, json_path)
+        return count
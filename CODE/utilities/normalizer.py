@@ -0,0 +1,117 @@
+import re
+import json
+import hashlib
+from functools import lru_cache
+
+from utilities.checkpoint_manager import CheckpointManager
+
+# Acronyms are expanded before title-casing; CASING_FIXES then repair what .title() gets wrong
+ACRONYMS = {
+    "LLM": "Large Language Models",
+    "LLMS": "Large Language Models",
+    "AI": "Artificial Intelligence",
+    "GENAI": "Generative AI",
+    "RAG": "Retrieval-Augmented Generation",
+    "ML": "Machine Learning",
+    "NLP": "Natural Language Processing"
+}
+CASING_FIXES = {
+    "Ai": "AI",
+    "Openai": "OpenAI",
+    "Genai": "GenAI",
+    "Llm": "LLM",
+    "Llms": "LLMs",
+    "Nlp": "NLP",
+    "Ml": "ML",
+    "Rag": "RAG"
+}
+# One pass for every fix; longer alternatives first so "Llms" is never cut short by "Llm"
+CASING_PATTERN = re.compile(r"\b(" + "|".join(sorted(CASING_FIXES, key=len, reverse=True)) + r")\b")
+
+# Changes whenever the rules above change, so files finalized under older rules are cleaned again
+RULES_VERSION = hashlib.md5(json.dumps([ACRONYMS, CASING_FIXES], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+FINALIZED_CHECKPOINT = "post_process_graph"
+
+@lru_cache(maxsize=None)
+def _clean_str(name):
+    upper_name = name.strip().upper()
+    if upper_name in ACRONYMS:
+        name = ACRONYMS[upper_name]
+    return CASING_PATTERN.sub(lambda m: CASING_FIXES[m.group(1)], name.title())
+
+def clean_name(name):
+    """Normalizes an entity name; memoized, since the same names repeat across thousands of documents."""
+    if not name:
+        return name
+    return _clean_str(str(name))
+
+def normalize_document(doc):
+    """Cleans the names of an extracted document in place; string entities become {"name", "type": "Unknown"}."""
+    if "entities" in doc:
+        normalized_entities = []
+        for ent in doc["entities"]:
+            if isinstance(ent, str):
+                ent = {"name": ent, "type": "Unknown"}
+
+            if isinstance(ent, dict) and "name" in ent:
+                ent["name"] = clean_name(ent["name"])
+                normalized_entities.append(ent)
+        doc["entities"] = normalized_entities
+
+    if "relationships" in doc:
+        normalized_rels = []
+        for rel in doc["relationships"]:
+            if isinstance(rel, dict):
+                if "source" in rel:
+                    rel["source"] = clean_name(rel["source"])
+                if "target" in rel:
+                    rel["target"] = clean_name(rel["target"])
+                normalized_rels.append(rel)
+        doc["relationships"] = normalized_rels
+    return doc
+
+def finalize_document(doc):
+    """
+    Final knowledge graph clean-up: cleans names (e.g. canonical names chosen by the LLM), drops entities
+    whose cleaned names collide and relationships that are empty or self-referencing.
+    Only modifies the document when something actually changes; returns True in that case.
+    """
+    changed = False
+    if "entities" in doc:
+        unique_ents = {}
+        for ent in doc["entities"]:
+            if "name" in ent:
+                name = clean_name(ent["name"])
+                if name != ent["name"]:
+                    ent["name"] = name
+                    changed = True
+            unique_ents[ent["name"]] = ent
+        # Deduplicate in case casing caused collisions
+        if len(unique_ents) != len(doc["entities"]):
+            doc["entities"] = list(unique_ents.values())
+            changed = True
+
+    if "relationships" in doc:
+        new_rels = []
+        for rel in doc["relationships"]:
+            for field in ("source", "target"):
+                value = clean_name(rel.get(field, ""))
+                if field not in rel or rel[field] != value:
+                    rel[field] = value
+                    changed = True
+
+            # Filter out empty and self-references
+            if rel["source"] and rel["target"] and rel["source"] != rel["target"]:
+                new_rels.append(rel)
+        if len(new_rels) != len(doc["relationships"]):
+            doc["relationships"] = new_rels
+            changed = True
+    return changed
+
+def is_finalized(path):
+    """True if `path` was last written by a finalizing pass under the current rules and has not changed since."""
+    state = CheckpointManager(FINALIZED_CHECKPOINT, path).load_state(match_source=True)
+    return state.get("rules_version") == RULES_VERSION
+
+def mark_finalized(path, document_count):
+    CheckpointManager(FINALIZED_CHECKPOINT, path).save_state({"rules_version": RULES_VERSION, "documents": document_count})
@@ -0,0 +1,68 @@
+import os
+import json
+import sqlite3
+from threading import Lock
+
+# SQLite caps the number of bound parameters per statement; stay well below it
+LOOKUP_BATCH = 500
+
+def pair_key(e1, e2):
+    """Order-independent key for an entity pair, so (A, B) and (B, A) share one entry."""
+    return json.dumps(sorted((e1, e2)), ensure_ascii=False)
+
+class PairDecisionStore:
+    """
+    Persistent LLM decisions for entity pairs, keyed by pair_key().
+    Backed by a local SQLite file: lookups only read the pairs a run actually asks about, and each
+    chunk of new decisions is one small transaction, however many decisions are already stored.
+    """
+
+    def __init__(self, store_path):
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        self.store_path = store_path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(store_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS decisions (
+                pair_key TEXT PRIMARY KEY,
+                decision TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, e1, e2):
+        """Returns the stored decision dict for a pair (in either order), or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT decision FROM decisions WHERE pair_key = ?", (pair_key(e1, e2),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, pairs):
+        """Returns {pair_key: decision} for the (e1, e2) pairs that have a stored decision."""
+        keys = list({pair_key(e1, e2) for e1, e2 in pairs})
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[i:i + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT pair_key, decision FROM decisions WHERE pair_key IN ({', '.join('?' for _ in batch)})", batch
+                ).fetchall()
+                found.update((key, json.loads(decision)) for key, decision in rows)
+        return found
+
+    def put_many(self, decisions):
+        """Stores decision dicts (each with e1 and e2) in one transaction; newer decisions replace older ones."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO decisions (pair_key, decision) VALUES (?, ?)",
+                [(pair_key(d["e1"], d["e2"]), json.dumps(d, ensure_ascii=False)) for d in decisions]
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .chunker import collapse_chunks
+
+# The combined query asks for this many times the chunks needed, so smaller sources are rarely crowded out
+OVERFETCH = 2
+
+def _split_results(results):
+    documents = results['documents'][0] if results.get('documents') else []
+    metadatas = results['metadatas'][0] if results.get('metadatas') else [{}] * len(documents)
+    return documents, [meta or {} for meta in metadatas]
+
+def query_by_source(collection, query_embedding, sources, per_source, chunks_per_source):
+    """
+    Top `per_source` documents of each source for one query vector, best chunk per document.
+    One unfiltered query is over-fetched and split by source in memory (a metadata filter over every
+    source costs more than the query itself). Only sources crowded out of it get their own filtered
+    query, run concurrently with the same vector.
+    Returns [(source, documents, metadatas, error)] in `sources` order; error is None on success.
+    """
+    sources = list(sources)
+    if not sources:
+        return []
+
+    n_results = chunks_per_source * len(sources) * OVERFETCH
+    grouped = {source: ([], []) for source in sources}
+    complete = False
+    try:
+        results = collection.query(query_embeddings=[query_embedding], n_results=n_results)
+        documents, metadatas = _split_results(results)
+        for doc, meta in zip(documents, metadatas):
+            if meta.get("source") in grouped:
+                grouped[meta["source"]][0].append(doc)
+                grouped[meta["source"]][1].append(meta)
+        # Fewer results than asked for means every chunk was returned
+        complete = len(documents) < n_results
+    except Exception as e:
+        print(f"Warning: combined retrieval failed, querying each source separately: {e}")
+
+    merged = {}
+    crowded_out = []
+    for source, (documents, metadatas) in grouped.items():
+        documents, metadatas = collapse_chunks(documents, metadatas, per_source)
+        if len(documents) == per_source or complete:
+            merged[source] = (documents, metadatas, None)
+        else:
+            crowded_out.append(source)
+
+    def query_source(source):
+        try:
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=chunks_per_source,
+                where={"source": source}
+            )
+            return source, (*collapse_chunks(*_split_results(results), per_source), None)
+        except Exception as e:
+            return source, ([], [], e)
+
+    if crowded_out:
+        with ThreadPoolExecutor(max_workers=len(crowded_out)) as pool:
+            merged.update(pool.map(query_source, crowded_out))
+    return [(source, *merged[source]) for source in sources]
@@ -0,0 +1,25 @@
+from functools import lru_cache
+
+# Qwen's tokenizer is not available through tiktoken; cl100k_base is close enough for budgeting
+ENCODING_NAME = "cl100k_base"
+
+# Rough characters-per-token ratio used when tiktoken or its encoding files are unavailable
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Returns the tiktoken encoding, or None if it cannot be loaded (e.g. offline without a cached BPE file)."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        print(f"⚠️ tiktoken unavailable ({e}). Falling back to a {CHARS_PER_TOKEN} chars/token estimate.")
+        return None
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+class UnionFind:
+    """
+    Disjoint-set forest over hashable items, with path halving and union by size.
+    Items are added lazily on first use. Roots are an implementation detail: callers that need a
+    stable name for a cluster should pick it from groups() with their own deterministic rule.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        self.add(item)
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        """Merges the clusters of a and b. Returns False if they were already in the same cluster."""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return False
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return True
+
+    def connected(self, a, b):
+        return self.find(a) == self.find(b)
+
+    def groups(self):
+        """Root -> list of members, for every cluster."""
+        clusters = defaultdict(list)
+        for item in self.parent:
+            clusters[self.find(item)].append(item)
+        return clusters
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def __len__(self):
+        return len(self.parent)
@@ -0,0 +1,96 @@
+import uuid
+import hashlib
+
+from .extraction_cache import content_hash
+
+# Records sent per ChromaDB call, and records read per page when listing the collection
+SYNC_BATCH = 1000
+PAGE_SIZE = 5000
+# Metadata key naming the model a record's vector came from, so switching models re-embeds it
+EMBEDDING_MODEL_KEY = "embedding_model"
+# Collection metadata key that changes whenever a sync changes the collection's content
+CONTENT_VERSION_KEY = "content_version"
+
+def document_id(source, url, content):
+    """
+    Content-addressed ID: the same post from the same source always gets the same ID, whatever its row
+    position, and an edited post gets a new one. Chunks of one post share the URL but not the content.
+    """
+    key = f"{source}\n{url}\n{content_hash(content)}"
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+def existing_metadata(collection, where=None):
+    """Returns {id: metadata} for every record in the collection (or matching `where`), without documents or embeddings."""
+    existing = {}
+    offset = 0
+    while True:
+        page = collection.get(where=where, include=["metadatas"], limit=PAGE_SIZE, offset=offset)
+        existing.update(zip(page["ids"], page["metadatas"]))
+        if len(page["ids"]) < PAGE_SIZE:
+            return existing
+        offset += PAGE_SIZE
+
+def content_version(collection):
+    """The collection's current content version (None until the first sync that changes it)."""
+    return (collection.metadata or {}).get(CONTENT_VERSION_KEY)
+
+def bump_content_version(collection):
+    # hnsw:* keys are fixed at creation and cannot be passed to modify()
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+    collection.modify(metadata={**metadata, CONTENT_VERSION_KEY: uuid.uuid4().hex})
+
+def replacement_metadata(old, new):
+    """ChromaDB merges metadata on update and upsert; keys set to None are removed, so dropped fields are cleared explicitly."""
+    return {**{key: None for key in old if key not in new}, **new}
+
+def sync_collection(collection, docs, metadatas, ids, where=None, embed=None):
+    """
+    Makes the collection (or the part of it matched by `where`) hold exactly these records.
+    Only documents with a new ID are embedded; records whose metadata changed are updated without
+    re-embedding, and records whose ID is gone are deleted. Duplicate IDs keep their first record.
+    With `embed` (e.g. utilities.embeddings.LocalEmbedder), vectors are computed up front in large
+    batches and passed to ChromaDB, and records embedded by another model are re-embedded;
+    otherwise ChromaDB embeds the documents itself.
+    Bumps the collection's content version when anything changed, so caches built on it can tell.
+    Returns a dict of counts: embedded (new or re-embedded), updated, deleted, unchanged.
+    """
+    records = {}
+    for doc, meta, doc_id in zip(docs, metadatas, ids):
+        if embed is not None:
+            meta = {**meta, EMBEDDING_MODEL_KEY: embed.model_name}
+        records.setdefault(doc_id, (doc, meta))
+
+    existing = existing_metadata(collection, where)
+    new_ids = [
+        doc_id for doc_id in records
+        if doc_id not in existing or existing[doc_id].get(EMBEDDING_MODEL_KEY) != records[doc_id][1].get(EMBEDDING_MODEL_KEY)
+    ]
+    embeddings = {}
+    if embed is not None and new_ids:
+        embeddings = dict(zip(new_ids, embed([records[doc_id][0] for doc_id in new_ids], show_progress=True)))
+    refreshed = set(new_ids)
+    changed_ids = [doc_id for doc_id in records if doc_id not in refreshed and existing[doc_id] != records[doc_id][1]]
+    orphan_ids = [doc_id for doc_id in existing if doc_id not in records]
+
+    for i in range(0, len(new_ids), SYNC_BATCH):
+        batch = new_ids[i:i + SYNC_BATCH]
+        collection.upsert(
+            documents=[records[doc_id][0] for doc_id in batch],
+            metadatas=[replacement_metadata(existing.get(doc_id, {}), records[doc_id][1]) for doc_id in batch],
+            embeddings=[embeddings[doc_id] for doc_id in batch] if embeddings else None,
+            ids=batch
+        )
+    for i in range(0, len(changed_ids), SYNC_BATCH):
+        batch = changed_ids[i:i + SYNC_BATCH]
+        collection.update(ids=batch, metadatas=[replacement_metadata(existing[doc_id], records[doc_id][1]) for doc_id in batch])
+    for i in range(0, len(orphan_ids), SYNC_BATCH):
+        collection.delete(ids=orphan_ids[i:i + SYNC_BATCH])
+    if new_ids or changed_ids or orphan_ids:
+        bump_content_version(collection)
+
+    return {
+        "embedded": len(new_ids),
+        "updated": len(changed_ids),
+        "deleted": len(orphan_ids),
+        "unchanged": len(records) - len(new_ids) - len(changed_ids)
+    }
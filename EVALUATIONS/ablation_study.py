@@ -9,6 +9,7 @@ from openai import OpenAI
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import VOYAGER_API_KEY, VOYAGER_BASE_URL, VOYAGER_MODEL_NAME, CHROMA_DB_PATH
 from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
+from CODE.utilities.embeddings import LocalEmbedder
 
 def run_ablation(output_dir):
     # Setup Clients
@@ -22,7 +23,7 @@ def run_ablation(output_dir):
     system_prompt = "You are TrendScout AI. Provide a concise, clear answer leveraging the EXACT context given below. Cite your sources. Ensure you cover investor names if present."
 
     # --- Run 1: Vector Only ---
-    v_results = collection.query(query_texts=[test_query], n_results=5)
+    v_results = collection.query(query_embeddings=LocalEmbedder()([test_query]), n_results=5)
     v_context_docs = v_results['documents'][0] if v_results['documents'] else []
     v_context_str = "\n".join(v_context_docs)
     
@@ -6,6 +6,7 @@ from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import VOYAGER_API_KEY, VOYAGER_BASE_URL, VOYAGER_MODEL_NAME, CHROMA_DB_PATH
+from CODE.utilities.embeddings import LocalEmbedder
 
 from datasets import Dataset
 from ragas import evaluate
@@ -53,10 +54,13 @@ def run_ragas(output_dir):
     answers = []
     contexts_lists = []
     
-    for q in questions:
+    # Same local model as the stored documents; cached, so repeated runs embed nothing
+    question_embeddings = LocalEmbedder()(questions)
+
+    for q, q_embedding in zip(questions, question_embeddings):
         # Retrieve context from Chroma
         results = collection.query(
-            query_texts=[q],
+            query_embeddings=[q_embedding],
             n_results=1
         )
         context_docs = results['documents'][0] if results['documents'] else ["No context found."]
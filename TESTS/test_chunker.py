@@ -0,0 +1,92 @@
+"""
+Regression tests for the shared chunker: chunks must cover the whole document in order, stay within
+the token budget, and overlap their predecessor by at most the overlap budget.
+"""
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "CODE"))
+
+import pytest
+
+from utilities.chunker import chunk_records, collapse_chunks, split_into_chunks, word_tokens
+from utilities.tokens import count_tokens
+
+def sample_text(words, seed):
+    """Words of varied token cost, each made unique so every chunk maps to exactly one position."""
+    rng = random.Random(seed)
+    vocabulary = ["market", "funding", "series", "startup", "inference", "GPU", "agentic", "workflow",
+                  "retrieval-augmented", "generation", "a", "of", "the", "2024", "$120M", "🚀"]
+    return " ".join(f"{rng.choice(vocabulary)}{i}" for i in range(words))
+
+def chunk_spans(text, chunks):
+    """(start, end) word positions of every chunk in the text."""
+    words = text.split()
+    position = {word: i for i, word in enumerate(words)}
+    spans = []
+    for chunk in chunks:
+        chunk_words = chunk.split()
+        start = position[chunk_words[0]]
+        assert words[start:start + len(chunk_words)] == chunk_words
+        spans.append((start, start + len(chunk_words)))
+    return spans
+
+@pytest.mark.parametrize("max_tokens,overlap_tokens", [(50, 10), (120, 30), (40, 0)])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_chunks_cover_the_text_in_order(max_tokens, overlap_tokens, seed):
+    text = sample_text(600, seed)
+    spans = chunk_spans(text, split_into_chunks(text, max_tokens, overlap_tokens))
+    assert len(spans) > 1
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text.split())
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        # No gap between chunks, and every chunk moves forward
+        assert start < next_start <= end
+        assert next_end > end
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_chunks_respect_token_and_overlap_budgets(seed):
+    max_tokens, overlap_tokens = 60, 15
+    text = sample_text(500, seed)
+    words = text.split()
+    spans = chunk_spans(text, split_into_chunks(text, max_tokens, overlap_tokens))
+
+    for start, end in spans:
+        assert sum(word_tokens(w) for w in words[start:end]) <= max_tokens
+    shared = [sum(word_tokens(w) for w in words[next_start:end]) for (_, end), (next_start, _) in zip(spans, spans[1:])]
+    assert all(tokens <= overlap_tokens for tokens in shared)
+    # Overlap is used whenever a word fits in it
+    assert any(tokens > 0 for tokens in shared)
+
+def test_short_text_is_returned_unchanged():
+    text = "  Short   post with  odd spacing "
+    assert count_tokens(text) <= 200
+    assert split_into_chunks(text, 200, 40) == [text]
+
+def test_overlong_word_is_kept_whole():
+    long_word = "x" * 400
+    chunks = split_into_chunks(f"before {long_word} after", 20, 5)
+    assert long_word in chunks
+    assert chunks[0] == "before" and chunks[-1] == "after"
+
+def test_chunk_records_link_chunks_to_their_document():
+    docs = [sample_text(400, 3), "A short post."]
+    metadatas = [{"source": "TechCrunch", "post_url": "https://example.com/a"}, {"source": "Reddit", "post_url": "https://example.com/b"}]
+    chunk_docs, chunk_metas, chunk_ids = chunk_records(docs, metadatas, max_tokens=80, overlap_tokens=20)
+
+    long_chunks = [m for m in chunk_metas if m["source"] == "TechCrunch"]
+    assert len(long_chunks) > 1
+    assert {m["parent_id"] for m in long_chunks} == {long_chunks[0]["parent_id"]}
+    assert [m["chunk_index"] for m in long_chunks] == list(range(len(long_chunks)))
+    assert all(m["chunk_count"] == len(long_chunks) for m in long_chunks)
+    assert len(set(chunk_ids)) == len(chunk_ids)
+    # A document that fits in one chunk keeps its parent ID as its own ID
+    assert chunk_ids[-1] == chunk_metas[-1]["parent_id"]
+
+    # Collapsing returns one chunk per document, best ranked first
+    kept_docs, kept_metas = collapse_chunks(chunk_docs[::-1], chunk_metas[::-1])
+    assert [m["source"] for m in kept_metas] == ["Reddit", "TechCrunch"]
+    assert kept_docs[1] == chunk_docs[len(long_chunks) - 1]
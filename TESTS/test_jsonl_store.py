@@ -0,0 +1,60 @@
+"""
+Regression tests for the append-only JSONL results log: a record cut off by an interrupted run is
+dropped on reopen, complete records are kept, and appending continues on a clean line.
+"""
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "CODE"))
+
+from utilities.jsonl_store import JsonlStore
+
+RECORDS = [{"id": i, "entities": [{"name": f"Entity {i}", "type": "Trend"}]} for i in range(3)]
+
+def write_log(path, records, tail=""):
+    store = JsonlStore(path)
+    for record in records:
+        store.append(record)
+    store.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(tail)
+
+def test_truncated_last_line_is_dropped(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write_log(path, RECORDS, tail=json.dumps({"id": 3, "entities": []})[:12])
+
+    store = JsonlStore(path)
+    assert list(store) == RECORDS
+    store.append({"id": 4})
+    store.close()
+    assert list(JsonlStore(path)) == RECORDS + [{"id": 4}]
+
+def test_complete_last_line_without_newline_is_kept(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write_log(path, RECORDS, tail=json.dumps({"id": 3}))
+
+    store = JsonlStore(path)
+    store.append({"id": 4})
+    store.close()
+    assert list(JsonlStore(path)) == RECORDS + [{"id": 3}, {"id": 4}]
+
+def test_file_holding_only_a_truncated_record_becomes_empty(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"id": 0, "ent')
+
+    store = JsonlStore(path)
+    assert list(store) == []
+    assert os.path.getsize(path) == 0
+
+def test_compact_to_writes_a_json_array(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write_log(path, RECORDS, tail='{"id": 3')
+    output = str(tmp_path / "results.json")
+
+    assert JsonlStore(path).compact_to(output) == len(RECORDS)
+    with open(output, encoding="utf-8") as f:
+        assert json.load(f) == RECORDS
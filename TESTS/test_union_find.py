@@ -0,0 +1,96 @@
+"""
+Regression tests for merge decisions: UnionFind, DecisionClusters and apply_decisions must reach
+the same clusters (and cluster names) whatever order the decisions arrive in.
+"""
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "CODE"))
+
+import config
+
+# entity_resolution checks the key format at import time; no request is ever sent by these tests
+if not config.VOYAGER_API_KEY.startswith("sk-"):
+    config.VOYAGER_API_KEY = "sk-test"
+
+from utilities.union_find import UnionFind
+from processing.entity_resolution import DecisionClusters, apply_decisions
+
+NAMES = [f"entity {i}" for i in range(40)]
+
+def sample_decisions(seed, count=120):
+    rng = random.Random(seed)
+    decisions = []
+    for _ in range(count):
+        e1, e2 = rng.sample(NAMES, 2)
+        decision = {"e1": e1, "e2": e2, "is_same": rng.random() < 0.4}
+        if decision["is_same"] and rng.random() < 0.5:
+            decision["canonical_name"] = rng.choice([e1, e2, "Canonical A", "Canonical B"])
+        decisions.append(decision)
+    return decisions
+
+def partition(groups):
+    return {frozenset(members) for members in groups}
+
+def shuffled(items, seed):
+    items = list(items)
+    random.Random(seed).shuffle(items)
+    return items
+
+def test_union_find_groups_do_not_depend_on_order():
+    pairs = [(d["e1"], d["e2"]) for d in sample_decisions(0) if d["is_same"]]
+    results = set()
+    for seed in range(10):
+        uf = UnionFind()
+        for a, b in shuffled(pairs, seed):
+            if seed % 2:
+                a, b = b, a
+            uf.union(a, b)
+        results.add(frozenset(partition(uf.groups().values())))
+    assert len(results) == 1
+
+def test_union_find_union_reports_merges():
+    uf = UnionFind()
+    assert uf.union("a", "b")
+    assert not uf.union("b", "a")
+    assert uf.connected("a", "b")
+    assert not uf.connected("a", "c")
+    assert len(uf) == 3
+
+def test_decision_clusters_do_not_depend_on_order():
+    decisions = sample_decisions(1)
+    # Only non-contradictory decisions have an order-independent answer; keep the ones a merge-first pass agrees with
+    merged = UnionFind()
+    for d in decisions:
+        if d["is_same"]:
+            merged.union(d["e1"], d["e2"])
+    consistent = [d for d in decisions if d["is_same"] or not merged.connected(d["e1"], d["e2"])]
+
+    expected = None
+    for seed in range(10):
+        clusters = DecisionClusters()
+        for d in shuffled(consistent, seed):
+            clusters.add(d)
+        groups = partition(clusters.clusters.groups().values())
+        implied = {(a, b): clusters.implied(a, b) for a in NAMES for b in NAMES}
+        if expected is None:
+            expected = (groups, implied)
+        assert (groups, implied) == expected
+
+    groups, implied = expected
+    for d in consistent:
+        assert implied[(d["e1"], d["e2"])] is d["is_same"]
+
+def test_apply_decisions_does_not_depend_on_order():
+    decisions = sample_decisions(2)
+    results = set()
+    for seed in range(10):
+        # Phase 1 mapping: every name is its own canonical name, plus one earlier local merge
+        name_mapping = {name: name for name in NAMES}
+        name_mapping["entity 39"] = "entity 38"
+        merged = apply_decisions(name_mapping, shuffled(decisions, seed))
+        results.add((merged, tuple(sorted(name_mapping.items()))))
+    assert len(results) == 1
@@ -23,14 +23,27 @@ STARTUPS_GALLERY_CLEANED_CSV_PATH = os.path.join(DATA_DIR_PROCESSED, "startups_g
 JOBBOARDS_CLEANED_CSV_PATH = os.path.join(DATA_DIR_PROCESSED, "jobboards_cleaned_for_extraction.csv")
 YCOMBINATOR_CLEANED_CSV_PATH = os.path.join(DATA_DIR_PROCESSED, "ycombinator_cleaned_for_extraction.csv")
 EXTRACTED_KNOWLEDGE_PATH = os.path.join(DATA_DIR_PROCESSED, "extracted_knowledge.json")
+EXTRACTED_KNOWLEDGE_JSONL_PATH = os.path.join(DATA_DIR_PROCESSED, "extracted_knowledge.jsonl")
 FINAL_KG_PATH = os.path.join(DATA_DIR_PROCESSED, "final_knowledge_graph.json")
 CHROMA_DB_PATH = os.path.join(DATA_DIR_PROCESSED, "chroma_db")
+CACHE_DIR = os.path.join(DATA_DIR_PROCESSED, ".cache")
+EXTRACTION_CACHE_PATH = os.path.join(CACHE_DIR, "extraction_cache.sqlite")
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embedding_cache.sqlite")
 
 # --- ASU VOYAGER CONFIG ---
 VOYAGER_MODEL_NAME = "qwen3-235b-a22b-instruct-2507" 
 VOYAGER_BASE_URL = "https://openai.rc.asu.edu/v1"
 VOYAGER_API_KEY = os.environ.get("VOYAGER_API_KEY", "")
 
+# --- LOCAL EMBEDDINGS ---
+# Same model as Chroma's default embedding function and the RAG evaluation
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# sentence-transformers backend: "torch", "onnx" (needs onnxruntime) or "openvino"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# Documents are split into overlapping chunks before indexing; MiniLM only reads the first 256 word pieces
+CHUNK_MAX_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 40
+
 # --- NEO4J CONFIG ---
 NEO4J_URI = os.environ.get("NEO4J_URI", "")
 NEO4J_USERNAME = os.environ.get("NEO4J_USERNAME", "")
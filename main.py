@@ -23,7 +23,8 @@ PIPELINE_MAP = {
         "CODE/processing/jobboards_ingestion.py",
         "CODE/processing/ycombinator_ingestion.py",
         "CODE/processing/extraction.py",
-        "CODE/processing/entity_resolution.py"
+        "CODE/processing/entity_resolution.py",
+        "CODE/post_process_graph.py"
     ],
     "upload": [
         "CODE/database/db_integration.py",